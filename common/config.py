@@ -7,32 +7,69 @@ Shared constants and configuration for C2 system
 HOST = '0.0.0.0'  # Server binds to all interfaces
 PORT = 4444       # Default C2 port
 
+# Server connection handling
+LISTENER_WORKERS = 64     # Worker threads for TLS handshakes, registration and token decisions
+HANDSHAKE_TIMEOUT = 30    # Seconds a new connection has to finish TLS and send its first message
+LISTEN_BACKLOG = 1024     # Kernel accept queue length (absorbs reconnect bursts)
+LISTEN_REUSEPORT = False  # SO_REUSEPORT: let several server processes share PORT (Linux/BSD)
+
 # Protocol limits
 MAX_MESSAGE_SIZE = 10 * 1024 * 1024  # 10MB max message size
 COMMAND_TIMEOUT = 30                  # Command execution timeout (seconds)
 SOCKET_TIMEOUT = 35                   # Socket response timeout (slightly more than command timeout)
+RESULT_CHUNK_SIZE = 64 * 1024         # Command output is streamed in chunks of at most this size
+
+# Client reconnect backoff (exponential with jitter)
+RECONNECT_DELAY_INITIAL = 1  # Seconds before the first retry
+RECONNECT_DELAY_MAX = 60     # Upper bound on the retry delay
 
 # Logging
 LOG_FILE = 'c2_server.log'
 LOG_LEVEL_CONSOLE = 'INFO'
 LOG_LEVEL_FILE = 'DEBUG'
+LOG_FILE_BUFFER = 64 * 1024  # Bytes of log file output buffered between flushes
+LOG_FLUSH_INTERVAL = 1       # Seconds between log file flushes (errors flush immediately)
+
+# Operator CLI
+CLI_HISTORY_FILE = '~/.c2_history'  # Persistent command history (readline)
+CLI_HISTORY_LENGTH = 1000           # Max history entries kept
 
 # TLS/SSL Configuration
 TLS_ENABLED = True
 SERVER_CERT = 'certs/server.crt'
 SERVER_KEY = 'certs/server.key'
+TLS_CIPHERS = 'ECDHE+AESGCM:ECDHE+CHACHA20'  # TLS 1.2 suites: forward secrecy + AEAD (AES-NI accelerated)
 
 # Token System
 TOKEN_FILE_CLIENT = 'client_token.txt'  # Client-side token storage
-TOKEN_POLL_INTERVAL = 5                  # Seconds between approval status checks
+TOKEN_POLL_INTERVAL = 5                  # Seconds between server-side approval status checks
+TOKEN_APPROVAL_TIMEOUT = 600             # Max seconds a client waits for operator approval
+TOKEN_KEEPALIVE_IDLE = 15                # Keepalive idle seconds while waiting for approval
+TOKEN_ALERT_COALESCE = 0.5               # Seconds in which repeat requests from one hostname share an alert
+DB_BUSY_TIMEOUT_MS = 5000                # Milliseconds a token DB connection waits on a lock
+VALIDATE_CACHE_TTL = 30                  # Seconds an approved token is trusted without a DB lookup
+
+# TCP keepalive (detects dead peers on long-idle connections)
+KEEPALIVE_IDLE = 30      # Seconds of idle before first probe
+KEEPALIVE_INTERVAL = 10  # Seconds between probes
+KEEPALIVE_COUNT = 3      # Failed probes before the connection is dropped
 
 # Message Types
 MSG_REGISTER = 'REGISTER'         # Client registration with token
 MSG_CMD = 'CMD'                   # Server sends command to client
 MSG_RESULT = 'RESULT'             # Client sends command result
+MSG_RESULT_CHUNK = 'RESULT_CHUNK' # Client streams part of a command's output
 MSG_TOKEN_REQUEST = 'TOKEN_REQUEST'  # Client requests new token
 MSG_TOKEN_STATUS = 'TOKEN_STATUS'    # Server sends token status
 
+# Message types pre-encoded for building/parsing raw wire payloads
+MSG_REGISTER_B = MSG_REGISTER.encode()
+MSG_CMD_B = MSG_CMD.encode()
+MSG_RESULT_B = MSG_RESULT.encode()
+MSG_RESULT_CHUNK_B = MSG_RESULT_CHUNK.encode()
+MSG_TOKEN_REQUEST_B = MSG_TOKEN_REQUEST.encode()
+MSG_TOKEN_STATUS_B = MSG_TOKEN_STATUS.encode()
+
 # Token States
 TOKEN_PENDING = 'pending'
 TOKEN_APPROVED = 'approved'
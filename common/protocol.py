@@ -4,8 +4,53 @@ Handles length-prefixed message encoding/decoding for C2 communication
 """
 
 import socket
+import ssl
 import struct
-from common.config import MAX_MESSAGE_SIZE
+import weakref
+from common.config import (
+    MAX_MESSAGE_SIZE, KEEPALIVE_IDLE, KEEPALIVE_INTERVAL, KEEPALIVE_COUNT
+)
+
+
+# 4-byte big-endian length header, compiled once
+_HEADER = struct.Struct('>I')
+
+# Size of each connection's reusable receive buffer. Messages that fit are
+# parsed straight out of it; larger ones are read into their own buffer.
+RECV_BUFFER_SIZE = 16 * 1024
+
+# Per-socket receive buffers - unconsumed bytes read ahead of the current message.
+# Keyed weakly on the socket object so closed sockets (and reused fds) never leak state.
+_recv_buffers = weakref.WeakKeyDictionary()
+
+
+class RecvBuffer:
+    """Fixed-size receive buffer reused for every message on one connection"""
+
+    __slots__ = ('data', 'view', 'start', 'end')
+
+    def __init__(self, size=RECV_BUFFER_SIZE):
+        self.data = bytearray(size)
+        self.view = memoryview(self.data)
+        self.start = 0  # First unconsumed byte
+        self.end = 0    # One past the last received byte
+
+    def __len__(self):
+        return self.end - self.start
+
+    def consume(self, n):
+        """
+        Mark the next n buffered bytes as read
+
+        Returns:
+            memoryview: The consumed bytes (valid until the buffer is refilled)
+        """
+        chunk = self.view[self.start:self.start + n]
+        self.start += n
+        if self.start == self.end:
+            # Drained - the next read starts at the front again
+            self.start = self.end = 0
+        return chunk
 
 
 def send_message(sock, message):
@@ -19,49 +64,94 @@ def send_message(sock, message):
     Returns:
         bool: True if successful, False otherwise
     """
-    try:
-        if isinstance(message, str):
-            message = message.encode('utf-8')
+    if isinstance(message, str):
+        message = message.encode('utf-8')
+
+    return send_message_parts(sock, [message])
+
+
+def send_message_parts(sock, parts):
+    """
+    Send one length-prefixed message built from several byte buffers
+
+    The buffers are framed as a single message without first being joined
+    into one payload, so large bodies are not copied on plain sockets.
+
+    Args:
+        sock: Socket object
+        parts: List of bytes-like objects forming the message body
 
-        # Send 4-byte length header (big-endian) + message
-        length = struct.pack('>I', len(message))
-        sock.sendall(length + message)
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        # 4-byte length header (big-endian) covering all parts
+        length = _HEADER.pack(sum(len(part) for part in parts))
+        if isinstance(sock, ssl.SSLSocket) or not hasattr(sock, 'sendmsg'):
+            # TLS copies into its own record buffer anyway - one sendall is cheapest
+            sock.sendall(b''.join([length, *parts]))
+        else:
+            # Scatter-gather: header and payload go out from their own buffers
+            sendmsg_all(sock, [length, *parts])
         return True
     except Exception as e:
         print(f"[!] Error sending message: {e}")
         return False
 
 
-def recv_message(sock):
+def recv_message(sock, decode=True):
     """
     Receive a length-prefixed message from socket
 
     Args:
         sock: Socket object
+        decode: Decode payload as UTF-8 (False returns the raw bytearray)
 
     Returns:
-        str: Decoded message, or None on error/disconnect
+        str: Decoded message (bytearray if decode=False), or None on error/disconnect
 
     Raises:
         socket.timeout: If socket timeout occurs (caller should handle)
     """
     try:
+        # Bytes already read off this socket but not yet consumed
+        buffer = _recv_buffers.get(sock)
+        if buffer is None:
+            buffer = _recv_buffers[sock] = RecvBuffer()
+
         # Read 4-byte length header
-        length_data = recv_exact(sock, 4)
-        if not length_data:
+        if not fill_buffer(sock, buffer, 4):
             return None
 
-        message_length = struct.unpack('>I', length_data)[0]
+        message_length = _HEADER.unpack(buffer.consume(4))[0]
 
         # Sanity check against configured max
         if message_length > MAX_MESSAGE_SIZE:
             raise Exception(f"Message size {message_length} exceeds limit {MAX_MESSAGE_SIZE}")
 
-        # Read exact message length
-        message_data = recv_exact(sock, message_length)
-        if not message_data:
+        if not message_length:
             return None
 
+        if message_length <= len(buffer.data):
+            # Small message - usually already buffered along with its header
+            if not fill_buffer(sock, buffer, message_length):
+                return None
+            payload = buffer.consume(message_length)
+            if decode:
+                # Decode straight out of the shared buffer - no intermediate copy
+                return str(payload, 'utf-8', 'replace')
+            return bytearray(payload)
+
+        # Large message - read the remainder straight into its own buffer
+        message_data = bytearray(message_length)
+        buffered = len(buffer)
+        message_data[:buffered] = buffer.consume(buffered)
+        if not recv_exact_into(sock, memoryview(message_data)[buffered:]):
+            return None
+
+        if not decode:
+            return message_data
+
         return message_data.decode('utf-8', errors='replace')
     except socket.timeout:
         # Let timeout propagate to caller - they should decide how to handle it
@@ -71,6 +161,58 @@ def recv_message(sock):
         return None
 
 
+def sendmsg_all(sock, buffers):
+    """
+    Send all buffers with sendmsg, resuming after partial writes
+
+    Args:
+        sock: Plain (non-TLS) socket object
+        buffers: List of bytes-like objects to send in order
+    """
+    views = [memoryview(buf) for buf in buffers if len(buf)]
+    while views:
+        sent = sock.sendmsg(views)
+
+        # Drop fully-sent buffers and trim the partially-sent one
+        while views and sent >= len(views[0]):
+            sent -= len(views[0])
+            views.pop(0)
+        if views and sent:
+            views[0] = views[0][sent:]
+
+
+def fill_buffer(sock, buffer, n):
+    """
+    Read from socket until buffer holds at least n unconsumed bytes
+
+    Each recv_into fills as much free space as the buffer has, so a small
+    message and its header usually arrive in a single call.
+
+    Args:
+        sock: Socket object
+        buffer: RecvBuffer to read into
+        n: Number of bytes the buffer must hold (at most its size)
+
+    Returns:
+        bool: True if filled, False if connection closed
+    """
+    if len(buffer) >= n:
+        return True
+
+    if buffer.start + n > len(buffer.data):
+        # Not enough room behind the unconsumed bytes - move them to the front
+        buffered = len(buffer)
+        buffer.view[:buffered] = buffer.view[buffer.start:buffer.end]
+        buffer.start, buffer.end = 0, buffered
+
+    while len(buffer) < n:
+        count = sock.recv_into(buffer.view[buffer.end:])
+        if not count:
+            return False
+        buffer.end += count
+    return True
+
+
 def recv_exact(sock, n):
     """
     Helper function to receive exactly n bytes from socket
@@ -80,12 +222,65 @@ def recv_exact(sock, n):
         n: Number of bytes to receive
 
     Returns:
-        bytes: Received data, or None if connection closed
+        bytearray: Received data, or None if connection closed
     """
-    data = b''
-    while len(data) < n:
-        chunk = sock.recv(n - len(data))
-        if not chunk:
-            return None
-        data += chunk
+    # Fill one preallocated buffer in place instead of growing a bytes object
+    data = bytearray(n)
+    if not recv_exact_into(sock, memoryview(data)):
+        return None
     return data
+
+
+def recv_exact_into(sock, view):
+    """
+    Fill a writable memoryview completely from socket
+
+    Args:
+        sock: Socket object
+        view: memoryview to fill
+
+    Returns:
+        bool: True if filled, False if connection closed
+    """
+    received = 0
+    while received < len(view):
+        count = sock.recv_into(view[received:])
+        if not count:
+            return False
+        received += count
+    return True
+
+
+def enable_keepalive(sock, idle=KEEPALIVE_IDLE, interval=KEEPALIVE_INTERVAL, count=KEEPALIVE_COUNT):
+    """
+    Enable TCP keepalive so the kernel detects dead peers on idle connections
+
+    Args:
+        sock: Socket object
+        idle: Seconds of idle before the first probe
+        interval: Seconds between probes
+        count: Failed probes before the connection is dropped
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    # Tuning knobs are platform specific - use whichever are available
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+    if hasattr(socket, 'TCP_KEEPCNT'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+
+
+def enable_nodelay(sock):
+    """
+    Disable Nagle's algorithm so small control messages are sent immediately
+
+    Args:
+        sock: Socket object
+    """
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    # Linux only: ACK right away instead of waiting to piggyback on a reply
+    if hasattr(socket, 'TCP_QUICKACK'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
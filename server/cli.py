@@ -2,293 +2,438 @@
 Operator CLI Module
 Interactive command-line interface for C2 operators
 """
+import atexit
+import os
 import sys
-from datetime import datetime
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from server.client_handler import (
     send_command_to_client,
     get_hostname_by_number,
-    clients_lock,
-    clients
+    notify_token_decision,
+    get_clients
 )
 from server.logger_config import logger
+from server.notifications import emit as _emit
 from server import token_manager
 from common.protocol import send_message
+from common.config import MSG_TOKEN_STATUS, TOKEN_REVOKED, CLI_HISTORY_FILE, CLI_HISTORY_LENGTH
 
+# GNU readline gives input() history and line editing (not available on Windows)
+try:
+    import readline
+except ImportError:
+    readline = None
 
-# ANSI Color codes for better UX
-class Colors:
-    RESET = '\033[0m'
-    RED = '\033[91m'
-    GREEN = '\033[92m'
-    YELLOW = '\033[93m'
-    BLUE = '\033[94m'
-    MAGENTA = '\033[95m'
-    CYAN = '\033[96m'
-    BOLD = '\033[1m'
-
-    @staticmethod
-    def disable():
-        """Disable colors for systems that don't support ANSI"""
-        Colors.RESET = ''
-        Colors.RED = ''
-        Colors.GREEN = ''
-        Colors.YELLOW = ''
-        Colors.BLUE = ''
-        Colors.MAGENTA = ''
-        Colors.CYAN = ''
-        Colors.BOLD = ''
+
+# ANSI Color codes for better UX (module constants - cheaper to look up than class attributes)
+RESET = '\033[0m'
+RED = '\033[91m'
+GREEN = '\033[92m'
+YELLOW = '\033[93m'
+BLUE = '\033[94m'
+MAGENTA = '\033[95m'
+CYAN = '\033[96m'
+BOLD = '\033[1m'
+
+_COLOR_NAMES = ('RESET', 'RED', 'GREEN', 'YELLOW', 'BLUE', 'MAGENTA', 'CYAN', 'BOLD')
+
+
+def disable_colors():
+    """Disable colors for systems that don't support ANSI"""
+    globals().update(dict.fromkeys(_COLOR_NAMES, ''))
+
+    # Static help text and row templates were formatted with the old codes
+    global _HELP_HEAD, _HELP_TAIL, _ROW_ACTIVE_TPL, _ROW_OFFLINE_TPL, _ROW_PENDING_TPL
+    _HELP_HEAD, _HELP_TAIL = _build_help_static()
+    _ROW_ACTIVE_TPL, _ROW_OFFLINE_TPL, _ROW_PENDING_TPL = _build_row_templates()
+
+
+# Divider lines, built once
+_EQ50 = '=' * 50
+_EQ60 = '=' * 60
+_EQ70 = '=' * 70
+_EQ80 = '=' * 80
+_EQ90 = '=' * 90
+_RULE90 = '─' * 90
+_DASH86 = '-' * 86
 
 
 # Global session state
 active_session = None
 
+# Out-of-band client notices (revoke/delete) - a full socket buffer mustn't freeze the prompt
+_notify_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='c2-notify')
+
+
+class _TokenCache:
+    """Token query results, reused until token_manager reports a change"""
+
+    def __init__(self):
+        self.generation = None
+        self.pending = None
+        self.all = None
+
+    def _sync(self):
+        # Read the generation before querying so a change mid-query forces a refetch next time
+        generation = token_manager.get_generation()
+        if generation != self.generation:
+            self.generation = generation
+            self.pending = None
+            self.all = None
+
+    def get_pending(self):
+        """Cached token_manager.get_pending_requests()"""
+        self._sync()
+        if self.pending is None:
+            self.pending = token_manager.get_pending_requests()
+        return self.pending
+
+    def get_all(self):
+        """Cached token_manager.get_all_tokens()"""
+        self._sync()
+        if self.all is None:
+            self.all = token_manager.get_all_tokens()
+        return self.all
+
+
+_token_cache = _TokenCache()
+
+
+def _pending_count():
+    """
+    Number of pending token requests for the prompt (cached until tokens change)
+
+    Returns:
+        int: Pending request count
+    """
+    return len(_token_cache.get_pending())
+
+
+def _build_help_static():
+    """
+    Build the fixed parts of the help text once
+
+    Returns:
+        tuple: (head, tail) strings surrounding the context-dependent examples
+    """
+    head = "\n".join([
+        f"\n{CYAN}{BOLD}{_EQ70}{RESET}",
+        f"{CYAN}{BOLD}  C2 SERVER - COMMAND REFERENCE{RESET}",
+        f"{CYAN}{BOLD}{_EQ70}{RESET}\n",
+
+        # Token Management Section
+        f"{YELLOW}{BOLD}📋 TOKEN MANAGEMENT:{RESET}",
+        f"  {BOLD}pending{RESET}                 - List pending token requests",
+        f"  {BOLD}approve <#|hostname>{RESET}    - Approve a token request (several: approve 1 2 3)",
+        f"  {BOLD}deny <#|hostname>{RESET}       - Deny a token request",
+        f"  {BOLD}addtoken <hostname>{RESET}     - Manually create a new token (several: addtoken A B)",
+        f"  {BOLD}revoke <#|hostname>{RESET}     - Revoke client access (temporary)",
+        f"  {BOLD}renew <hostname>{RESET}        - Renew a revoked token",
+        f"  {BOLD}delete <#|hostname>{RESET}     - Permanently delete token",
+        f"  {BOLD}tokens{RESET}                  - List all tokens with status",
+
+        # Client Management Section
+        f"\n{GREEN}{BOLD}💻 CLIENT MANAGEMENT:{RESET}",
+        f"  {BOLD}list / sessions{RESET}         - Show all clients and tokens",
+        f"  {BOLD}use <#|hostname>{RESET}        - Select and interact with a client",
+        f"  {BOLD}help{RESET}                    - Show this help message",
+        f"  {BOLD}exit{RESET}                    - Shutdown server",
+
+        # Session Commands Section
+        f"\n{MAGENTA}{BOLD}🔧 SESSION COMMANDS (when connected to a client):{RESET}",
+        f"  {BOLD}<any command>{RESET}           - Execute command on client",
+        f"  {BOLD}back / exit / q{RESET}         - Exit current session",
+        f"\n{YELLOW}  💡 Smart Disambiguation:{RESET}",
+        f"     When you type {BOLD}list{RESET}, {BOLD}help{RESET}, or similar commands in a session,",
+        f"     you'll be asked whether you want to run it on the client or server.",
+
+        # Examples Section header - examples themselves depend on current state
+        f"\n{CYAN}{BOLD}📚 EXAMPLES:{RESET}",
+    ])
+
+    tail = "\n".join([
+        # Quick Tips
+        f"\n{MAGENTA}{BOLD}💡 QUICK TIPS:{RESET}",
+        f"  • Use numbers instead of hostnames: {BOLD}use 1{RESET} vs {BOLD}use DESKTOP-ABC{RESET}",
+        f"  • Type {BOLD}list{RESET} to see an overview of everything",
+        f"  • Commands support both # and hostname: {BOLD}approve 1{RESET} or {BOLD}approve DESKTOP-ABC{RESET}",
+        f"\n{CYAN}{BOLD}{_EQ70}{RESET}\n",
+    ])
+
+    return head, tail
+
+
+# Static help text, formatted once (rebuilt by disable_colors)
+_HELP_HEAD, _HELP_TAIL = _build_help_static()
+
 
 def show_help():
     """Display context-aware help information"""
+    # Local aliases - avoid a global lookup per color use
+    cyan, reset, bold, green, yellow = CYAN, RESET, BOLD, GREEN, YELLOW
+
     # Get current state for context-aware tips
-    pending_count = len(token_manager.get_pending_requests())
-    with clients_lock:
-        client_list = [(idx, hostname, info) for idx, (hostname, info) in enumerate(clients.items(), 1)]
-
-    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*70}{Colors.RESET}")
-    print(f"{Colors.CYAN}{Colors.BOLD}  C2 SERVER - COMMAND REFERENCE{Colors.RESET}")
-    print(f"{Colors.CYAN}{Colors.BOLD}{'='*70}{Colors.RESET}\n")
-
-    # Token Management Section
-    print(f"{Colors.YELLOW}{Colors.BOLD}📋 TOKEN MANAGEMENT:{Colors.RESET}")
-    print(f"  {Colors.BOLD}pending{Colors.RESET}                 - List pending token requests")
-    print(f"  {Colors.BOLD}approve <#|hostname>{Colors.RESET}    - Approve a token request")
-    print(f"  {Colors.BOLD}deny <#|hostname>{Colors.RESET}       - Deny a token request")
-    print(f"  {Colors.BOLD}addtoken <hostname>{Colors.RESET}     - Manually create a new token")
-    print(f"  {Colors.BOLD}revoke <#|hostname>{Colors.RESET}     - Revoke client access (temporary)")
-    print(f"  {Colors.BOLD}renew <hostname>{Colors.RESET}        - Renew a revoked token")
-    print(f"  {Colors.BOLD}delete <#|hostname>{Colors.RESET}     - Permanently delete token")
-    print(f"  {Colors.BOLD}tokens{Colors.RESET}                  - List all tokens with status")
-
-    # Client Management Section
-    print(f"\n{Colors.GREEN}{Colors.BOLD}💻 CLIENT MANAGEMENT:{Colors.RESET}")
-    print(f"  {Colors.BOLD}list / sessions{Colors.RESET}         - Show all clients and tokens")
-    print(f"  {Colors.BOLD}use <#|hostname>{Colors.RESET}        - Select and interact with a client")
-    print(f"  {Colors.BOLD}help{Colors.RESET}                    - Show this help message")
-    print(f"  {Colors.BOLD}exit{Colors.RESET}                    - Shutdown server")
-
-    # Session Commands Section
-    print(f"\n{Colors.MAGENTA}{Colors.BOLD}🔧 SESSION COMMANDS (when connected to a client):{Colors.RESET}")
-    print(f"  {Colors.BOLD}<any command>{Colors.RESET}           - Execute command on client")
-    print(f"  {Colors.BOLD}back / exit / q{Colors.RESET}         - Exit current session")
-    print(f"\n{Colors.YELLOW}  💡 Smart Disambiguation:{Colors.RESET}")
-    print(f"     When you type {Colors.BOLD}list{Colors.RESET}, {Colors.BOLD}help{Colors.RESET}, or similar commands in a session,")
-    print(f"     you'll be asked whether you want to run it on the client or server.")
-
-    # Examples Section with Context
-    print(f"\n{Colors.CYAN}{Colors.BOLD}📚 EXAMPLES:{Colors.RESET}")
+    pending = _token_cache.get_pending()
+    pending_count = len(pending)
+    client_list = list(enumerate(get_clients(), 1))
+
+    lines = [_HELP_HEAD]
 
     if pending_count > 0:
-        print(f"  {Colors.YELLOW}You have {pending_count} pending request(s)! Try:{Colors.RESET}")
-        print(f"     {Colors.BOLD}pending{Colors.RESET}          - View pending token requests")
-        print(f"     {Colors.BOLD}approve 1{Colors.RESET}        - Approve first pending request")
+        lines.append(f"  {yellow}You have {pending_count} pending request(s)! Try:{reset}")
+        lines.append(f"     {bold}pending{reset}          - View pending token requests")
+        lines.append(f"     {bold}{'approve ' + str(pending[0][0]):<17}{reset}- Approve first pending request")
 
     if client_list:
         example_hostname = client_list[0][1]
-        print(f"  {Colors.GREEN}You have {len(client_list)} connected client(s)! Try:{Colors.RESET}")
-        print(f"     {Colors.BOLD}use 1{Colors.RESET}            - Connect to {example_hostname}")
-        print(f"     {Colors.BOLD}list{Colors.RESET}             - See all connected clients")
+        lines.append(f"  {green}You have {len(client_list)} connected client(s)! Try:{reset}")
+        lines.append(f"     {bold}use 1{reset}            - Connect to {example_hostname}")
+        lines.append(f"     {bold}list{reset}             - See all connected clients")
 
     if pending_count == 0 and not client_list:
-        print(f"  {Colors.CYAN}Getting started:{Colors.RESET}")
-        print(f"     {Colors.BOLD}list{Colors.RESET}             - Check system status")
-        print(f"     {Colors.BOLD}pending{Colors.RESET}          - View token requests")
-        print(f"  {Colors.CYAN}After a client connects:{Colors.RESET}")
-        print(f"     {Colors.BOLD}use 1{Colors.RESET}            - Connect to first client")
-        print(f"     {Colors.BOLD}whoami{Colors.RESET}           - Run command on client")
+        lines.append(f"  {cyan}Getting started:{reset}")
+        lines.append(f"     {bold}list{reset}             - Check system status")
+        lines.append(f"     {bold}pending{reset}          - View token requests")
+        lines.append(f"  {cyan}After a client connects:{reset}")
+        lines.append(f"     {bold}use 1{reset}            - Connect to first client")
+        lines.append(f"     {bold}whoami{reset}           - Run command on client")
 
-    # Quick Tips
-    print(f"\n{Colors.MAGENTA}{Colors.BOLD}💡 QUICK TIPS:{Colors.RESET}")
-    print(f"  • Use numbers instead of hostnames: {Colors.BOLD}use 1{Colors.RESET} vs {Colors.BOLD}use DESKTOP-ABC{Colors.RESET}")
-    print(f"  • Type {Colors.BOLD}list{Colors.RESET} to see an overview of everything")
-    print(f"  • Commands support both # and hostname: {Colors.BOLD}approve 1{Colors.RESET} or {Colors.BOLD}approve DESKTOP-ABC{Colors.RESET}")
+    lines.append(_HELP_TAIL)
 
-    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*70}{Colors.RESET}\n")
+    _emit(lines)
 
 
-def list_clients():
-    """Display comprehensive overview: all clients organized by status"""
-    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*90}{Colors.RESET}")
-    print(f"{Colors.CYAN}{Colors.BOLD}  C2 SERVER - CLIENT OVERVIEW{Colors.RESET}")
-    print(f"{Colors.CYAN}{Colors.BOLD}{'='*90}{Colors.RESET}\n")
+def _build_row_templates():
+    """
+    Build list_clients() row templates with color codes already substituted
 
-    # Get all tokens from database
-    all_tokens = token_manager.get_all_tokens()
+    Returns:
+        tuple: (active, offline, pending) str.format templates
+    """
+    active = (f"  {GREEN}[{{idx}}]{RESET}  {BOLD}{{host:<25}}{RESET} "
+              f"{GREEN}{{status:<15}}{RESET} {YELLOW}{{sid:<12}}{RESET} "
+              f"{CYAN}{{ip}}{RESET}")
+    offline = (f"  {BOLD}{{host:<25}}{RESET} "
+               f"{BLUE}{{status:<15}}{RESET} "
+               f"{CYAN}{{ip:<20}}{RESET} {{when}}")
+    pending = (f"  {YELLOW}[{{idx}}]{RESET}  {BOLD}{{host:<25}}{RESET} "
+               f"{YELLOW}{{status:<15}}{RESET} "
+               f"{CYAN}{{ip:<20}}{RESET} {{when}}")
+    return active, offline, pending
 
-    # Get currently connected clients
-    with clients_lock:
-        connected_hostnames = set(clients.keys())
-        connected_clients_info = dict(clients)
 
-    # Organize clients by status
-    approved_connected = []
-    approved_disconnected = []
-    pending_clients = []
-    revoked_clients = []
-    denied_clients = []
+# Row templates, formatted once (rebuilt by disable_colors)
+_ROW_ACTIVE_TPL, _ROW_OFFLINE_TPL, _ROW_PENDING_TPL = _build_row_templates()
 
-    for token_info in all_tokens:
-        hostname, status, ip_address, requested_at, approved_at, revoked_at = token_info
 
-        if status == 'approved':
-            if hostname in connected_hostnames:
-                approved_connected.append((hostname, ip_address, approved_at, connected_clients_info[hostname]))
-            else:
-                approved_disconnected.append((hostname, ip_address, approved_at))
-        elif status == 'pending':
-            pending_clients.append((hostname, ip_address, requested_at))
-        elif status == 'revoked':
-            revoked_clients.append((hostname, ip_address, revoked_at))
-        elif status == 'denied':
-            denied_clients.append((hostname, ip_address, requested_at))
+def _want_colors():
+    """
+    Decide whether to emit ANSI colors
+
+    FORCE_COLOR wins, then NO_COLOR; otherwise colors only when stdout is a terminal.
+
+    Returns:
+        bool: True to keep colors
+    """
+    if os.environ.get('FORCE_COLOR'):
+        return True
+    if os.environ.get('NO_COLOR'):
+        return False
+    isatty = getattr(sys.stdout, 'isatty', None)
+    return bool(isatty and isatty())
+
+
+# Redirected output gets plain text - no escape codes in files or pipes
+if not _want_colors():
+    disable_colors()
+
+
+def list_clients():
+    """Display comprehensive overview: all clients organized by status"""
+    # Local aliases - avoid a global lookup per color use
+    cyan, reset, bold, green, yellow, magenta, red, blue = CYAN, RESET, BOLD, GREEN, YELLOW, MAGENTA, RED, BLUE
+
+    lines = []
+    lines.append(f"\n{cyan}{bold}{_EQ90}{reset}")
+    lines.append(f"{cyan}{bold}  C2 SERVER - CLIENT OVERVIEW{reset}")
+    lines.append(f"{cyan}{bold}{_EQ90}{reset}\n")
+
+    # Get all tokens from database
+    all_tokens = _token_cache.get_all()
+
+    # Get currently connected clients (the registry is copy-on-write - no copy needed)
+    connected_clients_info = get_clients()
+    connected_hostnames = connected_clients_info.keys()
+
+    # Organize clients by status - one hash lookup per row instead of an if/elif ladder
+    buckets = defaultdict(list)
+    for hostname, status, ip_address, requested_at, approved_at, revoked_at in all_tokens:
+        buckets[status].append((hostname, ip_address, requested_at, approved_at, revoked_at))
+
+    approved_connected = [(hostname, ip_address, approved_at, connected_clients_info[hostname])
+                          for hostname, ip_address, _, approved_at, _ in buckets['approved']
+                          if hostname in connected_hostnames]
+    approved_disconnected = [(hostname, ip_address, approved_at)
+                             for hostname, ip_address, _, approved_at, _ in buckets['approved']
+                             if hostname not in connected_hostnames]
+    # Pending rows carry the DB id so the list matches the 'pending' command
+    pending_clients = _token_cache.get_pending()
+    revoked_clients = [(hostname, ip_address, revoked_at)
+                       for hostname, ip_address, _, _, revoked_at in buckets['revoked']]
+    denied_clients = [(hostname, ip_address, requested_at)
+                      for hostname, ip_address, requested_at, _, _ in buckets['denied']]
 
     # Section 1: Active & Connected Clients
-    print(f"{Colors.GREEN}{Colors.BOLD}● ACTIVE CLIENTS (Connected & Authenticated){Colors.RESET}")
-    print(f"{Colors.CYAN}{'─'*90}{Colors.RESET}")
+    lines.append(f"{green}{bold}● ACTIVE CLIENTS (Connected & Authenticated){reset}")
+    lines.append(f"{cyan}{_RULE90}{reset}")
 
     if not approved_connected:
-        print(f"  {Colors.YELLOW}No active clients{Colors.RESET}")
+        lines.append(f"  {yellow}No active clients{reset}")
     else:
-        print(f"  {'#':<4} {'HOSTNAME':<25} {'STATUS':<15} {'SESSION':<12} {'IP ADDRESS':<20}")
-        print(f"  {Colors.CYAN}{'-'*86}{Colors.RESET}")
+        lines.append(f"  {'#':<4} {'HOSTNAME':<25} {'STATUS':<15} {'SESSION':<12} {'IP ADDRESS':<20}")
+        lines.append(f"  {cyan}{_DASH86}{reset}")
         for idx, (hostname, ip_address, approved_at, client_info) in enumerate(approved_connected, 1):
             addr = client_info['address']
             session_id = client_info['session_id']
             ip_str = f"{addr[0]}:{addr[1]}"
             status_text = "✓ Online"
-            print(f"  {Colors.GREEN}[{idx}]{Colors.RESET}  {Colors.BOLD}{hostname:<25}{Colors.RESET} "
-                  f"{Colors.GREEN}{status_text:<15}{Colors.RESET} {Colors.YELLOW}{session_id:<12}{Colors.RESET} "
-                  f"{Colors.CYAN}{ip_str}{Colors.RESET}")
+            lines.append(_ROW_ACTIVE_TPL.format(idx=idx, host=hostname, status=status_text,
+                                                sid=session_id, ip=ip_str))
 
-    print()
+    lines.append("")
 
     # Section 2: Approved but Offline
-    print(f"{Colors.BLUE}{Colors.BOLD}● APPROVED CLIENTS (Offline){Colors.RESET}")
-    print(f"{Colors.CYAN}{'─'*90}{Colors.RESET}")
+    lines.append(f"{blue}{bold}● APPROVED CLIENTS (Offline){reset}")
+    lines.append(f"{cyan}{_RULE90}{reset}")
 
     if not approved_disconnected:
-        print(f"  {Colors.GREEN}No offline approved clients{Colors.RESET}")
+        lines.append(f"  {green}No offline approved clients{reset}")
     else:
-        print(f"  {'HOSTNAME':<25} {'STATUS':<15} {'IP ADDRESS':<20} {'APPROVED':<20}")
-        print(f"  {Colors.CYAN}{'-'*86}{Colors.RESET}")
+        lines.append(f"  {'HOSTNAME':<25} {'STATUS':<15} {'IP ADDRESS':<20} {'APPROVED':<20}")
+        lines.append(f"  {cyan}{_DASH86}{reset}")
         for hostname, ip_address, approved_at in approved_disconnected:
             ip_str = ip_address if ip_address else "unknown"
             status_text = "✓ Offline"
-            print(f"  {Colors.BOLD}{hostname:<25}{Colors.RESET} "
-                  f"{Colors.BLUE}{status_text:<15}{Colors.RESET} "
-                  f"{Colors.CYAN}{ip_str:<20}{Colors.RESET} {approved_at}")
+            lines.append(_ROW_OFFLINE_TPL.format(host=hostname, status=status_text,
+                                                 ip=ip_str, when=approved_at))
 
-    print()
+    lines.append("")
 
     # Section 3: Pending Requests
-    print(f"{Colors.YELLOW}{Colors.BOLD}● PENDING REQUESTS (Awaiting Approval){Colors.RESET}")
-    print(f"{Colors.CYAN}{'─'*90}{Colors.RESET}")
+    lines.append(f"{yellow}{bold}● PENDING REQUESTS (Awaiting Approval){reset}")
+    lines.append(f"{cyan}{_RULE90}{reset}")
 
     if not pending_clients:
-        print(f"  {Colors.GREEN}No pending requests{Colors.RESET}")
+        lines.append(f"  {green}No pending requests{reset}")
     else:
-        print(f"  {'HOSTNAME':<25} {'STATUS':<15} {'IP ADDRESS':<20} {'REQUESTED':<20}")
-        print(f"  {Colors.CYAN}{'-'*86}{Colors.RESET}")
-        for hostname, ip_address, requested_at in pending_clients:
+        lines.append(f"  {'#':<4} {'HOSTNAME':<25} {'STATUS':<15} {'IP ADDRESS':<20} {'REQUESTED':<20}")
+        lines.append(f"  {cyan}{_DASH86}{reset}")
+        for token_id, hostname, ip_address, requested_at in pending_clients:
             ip_str = ip_address if ip_address else "unknown"
             status_text = "⏳ Pending"
-            print(f"  {Colors.BOLD}{hostname:<25}{Colors.RESET} "
-                  f"{Colors.YELLOW}{status_text:<15}{Colors.RESET} "
-                  f"{Colors.CYAN}{ip_str:<20}{Colors.RESET} {requested_at}")
-        print(f"\n  {Colors.YELLOW}→ Use 'approve <#|hostname>' to approve{Colors.RESET}")
+            lines.append(_ROW_PENDING_TPL.format(idx=token_id, host=hostname, status=status_text,
+                                                 ip=ip_str, when=requested_at))
+        lines.append(f"\n  {yellow}→ Use 'approve <#|hostname>' to approve{reset}")
 
-    print()
+    lines.append("")
 
     # Section 4: Revoked & Denied (always show this section)
-    print(f"{Colors.RED}{Colors.BOLD}● REVOKED / DENIED CLIENTS{Colors.RESET}")
-    print(f"{Colors.CYAN}{'─'*90}{Colors.RESET}")
+    lines.append(f"{red}{bold}● REVOKED / DENIED CLIENTS{reset}")
+    lines.append(f"{cyan}{_RULE90}{reset}")
 
     if not revoked_clients and not denied_clients:
-        print(f"  {Colors.GREEN}No revoked or denied clients{Colors.RESET}")
+        lines.append(f"  {green}No revoked or denied clients{reset}")
     else:
         if revoked_clients:
-            print(f"  {Colors.RED}Revoked ({len(revoked_clients)}):{Colors.RESET}")
+            lines.append(f"  {red}Revoked ({len(revoked_clients)}):{reset}")
             for hostname, ip_address, revoked_at in revoked_clients:
                 ip_str = ip_address if ip_address else "unknown"
-                print(f"    • {Colors.BOLD}{hostname}{Colors.RESET} {Colors.CYAN}({ip_str}){Colors.RESET} - {revoked_at}")
-            print()
+                lines.append(f"    • {bold}{hostname}{reset} {cyan}({ip_str}){reset} - {revoked_at}")
+            lines.append("")
 
         if denied_clients:
-            print(f"  {Colors.RED}Denied ({len(denied_clients)}):{Colors.RESET}")
+            lines.append(f"  {red}Denied ({len(denied_clients)}):{reset}")
             for hostname, ip_address, requested_at in denied_clients:
                 ip_str = ip_address if ip_address else "unknown"
-                print(f"    • {Colors.BOLD}{hostname}{Colors.RESET} {Colors.CYAN}({ip_str}){Colors.RESET} - {requested_at}")
+                lines.append(f"    • {bold}{hostname}{reset} {cyan}({ip_str}){reset} - {requested_at}")
 
-    print()
+    lines.append("")
 
-    print(f"{Colors.CYAN}{Colors.BOLD}{'='*90}{Colors.RESET}\n")
+    lines.append(f"{cyan}{bold}{_EQ90}{reset}\n")
 
     # Quick action hints
-    print(f"{Colors.YELLOW}📋 AVAILABLE COMMANDS:{Colors.RESET}")
+    lines.append(f"{yellow}📋 AVAILABLE COMMANDS:{reset}")
     if pending_clients:
-        print(f"  {Colors.GREEN}approve <#|hostname>{Colors.RESET}  - Approve a pending request")
-        print(f"  {Colors.RED}deny <#|hostname>{Colors.RESET}     - Deny a pending request")
+        lines.append(f"  {green}approve <#|hostname>{reset}  - Approve a pending request")
+        lines.append(f"  {red}deny <#|hostname>{reset}     - Deny a pending request")
     if approved_connected:
-        print(f"  {Colors.CYAN}use <#|hostname>{Colors.RESET}      - Connect to an active client")
+        lines.append(f"  {cyan}use <#|hostname>{reset}      - Connect to an active client")
     if approved_connected or approved_disconnected:
-        print(f"  {Colors.RED}revoke <#|hostname>{Colors.RESET}   - Revoke client access and kick")
-        print(f"  {Colors.RED}delete <#|hostname>{Colors.RESET}   - Permanently delete token and kick")
+        lines.append(f"  {red}revoke <#|hostname>{reset}   - Revoke client access and kick")
+        lines.append(f"  {red}delete <#|hostname>{reset}   - Permanently delete token and kick")
     if revoked_clients:
-        print(f"  {Colors.BLUE}renew <hostname>{Colors.RESET}      - Renew a revoked token")
-    print(f"  {Colors.MAGENTA}addtoken <hostname>{Colors.RESET}   - Manually create a new token")
-    print()
+        lines.append(f"  {blue}renew <hostname>{reset}      - Renew a revoked token")
+    lines.append(f"  {magenta}addtoken <hostname>{reset}   - Manually create a new token")
+    lines.append("")
+
+    _emit(lines)
 
 
 def list_pending_requests():
     """Display all pending token requests"""
-    pending = token_manager.get_pending_requests()
+    # Local aliases - avoid a global lookup per color use
+    cyan, reset, bold, green, yellow = CYAN, RESET, BOLD, GREEN, YELLOW
+
+    pending = _token_cache.get_pending()
 
     if not pending:
-        print(f"\n{Colors.YELLOW}[*] No pending token requests{Colors.RESET}\n")
+        print(f"\n{yellow}[*] No pending token requests{reset}\n")
         return
 
-    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}")
-    print(f"{Colors.CYAN}{Colors.BOLD}  Pending Token Requests{Colors.RESET}")
-    print(f"{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}")
+    lines = []
+    lines.append(f"\n{cyan}{bold}{_EQ60}{reset}")
+    lines.append(f"{cyan}{bold}  Pending Token Requests{reset}")
+    lines.append(f"{cyan}{bold}{_EQ60}{reset}")
 
-    for idx, (hostname, ip_address, requested_at) in enumerate(pending, 1):
+    for token_id, hostname, ip_address, requested_at in pending:
         ip_str = ip_address if ip_address else "unknown"
-        print(f"  {Colors.YELLOW}[{idx}]{Colors.RESET} {Colors.BOLD}{hostname}{Colors.RESET} "
-              f"{Colors.CYAN}({ip_str}){Colors.RESET} - {Colors.GREEN}{requested_at}{Colors.RESET}")
+        lines.append(f"  {yellow}[{token_id}]{reset} {bold}{hostname}{reset} "
+                     f"{cyan}({ip_str}){reset} - {green}{requested_at}{reset}")
 
-    print(f"{Colors.CYAN}{Colors.BOLD}{'='*60}{Colors.RESET}\n")
-    print(f"{Colors.GREEN}Use 'approve <#|hostname>' to approve a request{Colors.RESET}\n")
+    lines.append(f"{cyan}{bold}{_EQ60}{reset}\n")
+    lines.append(f"{green}Use 'approve <#|hostname>' to approve a request{reset}\n")
+    _emit(lines)
 
 
 def list_all_tokens():
     """Display all tokens with their status"""
-    all_tokens = token_manager.get_all_tokens()
+    # Local aliases - avoid a global lookup per color use
+    cyan, reset, bold, green, yellow, red = CYAN, RESET, BOLD, GREEN, YELLOW, RED
+
+    all_tokens = _token_cache.get_all()
 
     if not all_tokens:
-        print(f"\n{Colors.YELLOW}[*] No tokens in database{Colors.RESET}\n")
+        print(f"\n{yellow}[*] No tokens in database{reset}\n")
         return
 
-    print(f"\n{Colors.CYAN}{Colors.BOLD}{'='*80}{Colors.RESET}")
-    print(f"{Colors.CYAN}{Colors.BOLD}  All Tokens{Colors.RESET}")
-    print(f"{Colors.CYAN}{Colors.BOLD}{'='*80}{Colors.RESET}")
+    lines = []
+    lines.append(f"\n{cyan}{bold}{_EQ80}{reset}")
+    lines.append(f"{cyan}{bold}  All Tokens{reset}")
+    lines.append(f"{cyan}{bold}{_EQ80}{reset}")
 
     for idx, (hostname, status, ip_address, requested_at, approved_at, revoked_at) in enumerate(all_tokens, 1):
         ip_str = ip_address if ip_address else "unknown"
 
         # Color status
         if status == 'approved':
-            status_str = f"{Colors.GREEN}{status}{Colors.RESET}"
+            status_str = f"{green}{status}{reset}"
         elif status == 'pending':
-            status_str = f"{Colors.YELLOW}{status}{Colors.RESET}"
+            status_str = f"{yellow}{status}{reset}"
         elif status == 'revoked':
-            status_str = f"{Colors.RED}{status}{Colors.RESET}"
+            status_str = f"{red}{status}{reset}"
         elif status == 'denied':
-            status_str = f"{Colors.RED}{status}{Colors.RESET}"
+            status_str = f"{red}{status}{reset}"
         else:
             status_str = status
 
@@ -300,15 +445,19 @@ def list_all_tokens():
         else:
             time_str = f"Requested: {requested_at}"
 
-        print(f"  {Colors.BOLD}[{idx}] {hostname}{Colors.RESET} - {status_str} - "
-              f"{Colors.CYAN}({ip_str}){Colors.RESET} - {Colors.GREEN}{time_str}{Colors.RESET}")
+        lines.append(f"  {bold}[{idx}] {hostname}{reset} - {status_str} - "
+                     f"{cyan}({ip_str}){reset} - {green}{time_str}{reset}")
 
-    print(f"{Colors.CYAN}{Colors.BOLD}{'='*80}{Colors.RESET}\n")
+    lines.append(f"{cyan}{bold}{_EQ80}{reset}\n")
+    _emit(lines)
 
 
 def get_pending_hostname_by_number(number):
     """
-    Convert pending request number to hostname
+    Convert pending request number (its database id) to hostname
+
+    Ids don't shift when other requests are approved or denied, so
+    "approve 3" followed by "approve 4" means what the listing showed.
 
     Args:
         number: Request number (as string or int)
@@ -317,29 +466,49 @@ def get_pending_hostname_by_number(number):
         str: Hostname or None if not found
     """
     try:
-        num = int(number)
-        pending = token_manager.get_pending_requests()
-
-        if 1 <= num <= len(pending):
-            return pending[num - 1][0]  # Return hostname
-        return None
-    except (ValueError, IndexError):
+        return token_manager.get_pending_hostname_by_id(int(number))
+    except ValueError:
         return None
 
 
 def approve_token(target):
-    """Approve a token request (supports number or hostname)"""
+    """Approve a token request (supports number or hostname, several separated by spaces)"""
+    targets = target.split()
+    if len(targets) > 1:
+        _approve_tokens(targets)
+        return
+
     # Try to resolve number to hostname
     hostname = get_pending_hostname_by_number(target) or target
 
     success, token = token_manager.approve_token(hostname)
 
     if success:
-        print(f"{Colors.GREEN}[+] Token approved for {hostname}{Colors.RESET}")
-        print(f"{Colors.CYAN}    Token: {token[:16]}...{Colors.RESET}")
+        notify_token_decision(hostname)
+        print(f"{GREEN}[+] Token approved for {hostname}{RESET}")
+        print(f"{CYAN}    Token: {token[:16]}...{RESET}")
         logger.info(f"Token approved for {hostname}")
     else:
-        print(f"{Colors.RED}[!] Failed to approve token for {hostname} (not found){Colors.RESET}")
+        print(f"{RED}[!] Failed to approve token for {hostname} (not found){RESET}")
+
+
+def _approve_tokens(targets):
+    """Approve several token requests in one database transaction"""
+    hostnames = [get_pending_hostname_by_number(target) or target for target in targets]
+    approved = token_manager.bulk_approve(hostnames)
+
+    lines = []
+    for hostname, token in approved:
+        notify_token_decision(hostname)
+        lines.append(f"{GREEN}[+] Token approved for {hostname}{RESET}")
+        lines.append(f"{CYAN}    Token: {token[:16]}...{RESET}")
+        logger.info(f"Token approved for {hostname}")
+
+    found = {hostname for hostname, _ in approved}
+    for hostname in dict.fromkeys(hostnames):
+        if hostname not in found:
+            lines.append(f"{RED}[!] Failed to approve token for {hostname} (not found){RESET}")
+    _emit(lines)
 
 
 def deny_token(target):
@@ -350,10 +519,34 @@ def deny_token(target):
     success = token_manager.deny_token(hostname)
 
     if success:
-        print(f"{Colors.YELLOW}[+] Token denied for {hostname}{Colors.RESET}")
+        notify_token_decision(hostname)
+        print(f"{YELLOW}[+] Token denied for {hostname}{RESET}")
         logger.info(f"Token denied for {hostname}")
     else:
-        print(f"{Colors.RED}[!] Failed to deny token for {hostname} (not found){Colors.RESET}")
+        print(f"{RED}[!] Failed to deny token for {hostname} (not found){RESET}")
+
+
+def _safe_notify(client_info, hostname, message, kind):
+    """
+    Send an out-of-band notice to a client (runs on the notify pool)
+
+    Args:
+        client_info: Client registry entry (socket, session_id, lock)
+        hostname: Client hostname (for logging)
+        message: Message to send
+        kind: Notice kind for log lines (e.g. 'revocation')
+    """
+    session_id = client_info['session_id']
+    try:
+        # Same lock as send_command_to_client - one writer per socket at a time
+        with client_info['lock']:
+            sent = send_message(client_info['socket'], message)
+        if sent:
+            logger.info(f"[SESSION:{session_id}] Sent {kind} notice to {hostname}")
+        else:
+            logger.warning(f"[SESSION:{session_id}] Failed to send {kind} notice to {hostname}")
+    except Exception as e:
+        logger.warning(f"[SESSION:{session_id}] Failed to send {kind} notice to {hostname}: {e}")
 
 
 def revoke_token(target):
@@ -366,41 +559,54 @@ def revoke_token(target):
     success = token_manager.revoke_token(hostname)
 
     if success:
-        print(f"{Colors.RED}[+] Token revoked for {hostname}{Colors.RESET}")
+        notify_token_decision(hostname)
+        print(f"{RED}[+] Token revoked for {hostname}{RESET}")
         logger.info(f"Token revoked for {hostname}")
 
         # Check if client is currently connected and kick them
-        with clients_lock:
-            if hostname in clients:
-                client_info = clients[hostname]
-                client_socket = client_info['socket']
-                session_id = client_info['session_id']
-
-                try:
-                    # Send revocation notice to client
-                    from common.config import MSG_TOKEN_STATUS, TOKEN_REVOKED
-                    send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_REVOKED}")
-                    logger.info(f"[SESSION:{session_id}] Sent revocation notice to {hostname}")
-                    print(f"{Colors.YELLOW}[*] Kicked {hostname} from server{Colors.RESET}")
-                except:
-                    pass
-
-                # Client handler will clean up the connection
+        client_info = get_clients().get(hostname)
+
+        if client_info:
+            # Send revocation notice to client without blocking the prompt
+            _notify_pool.submit(_safe_notify, client_info, hostname,
+                                f"{MSG_TOKEN_STATUS}:{TOKEN_REVOKED}", "revocation")
+            print(f"{YELLOW}[*] Kicked {hostname} from server{RESET}")
+
+            # The client closes its end on the notice; its registry entry is
+            # dropped by disconnect_client when the next command to it fails
     else:
-        print(f"{Colors.RED}[!] Failed to revoke token for {target} (not found){Colors.RESET}")
+        print(f"{RED}[!] Failed to revoke token for {target} (not found){RESET}")
 
 
 def add_token_manual(hostname):
-    """Manually add and approve a token"""
+    """Manually add and approve a token (several hostnames separated by spaces)"""
+    hostnames = hostname.split()
+    if len(hostnames) > 1:
+        _add_tokens(hostnames)
+        return
+
     success, token = token_manager.add_token_manual(hostname)
 
     if success:
-        print(f"{Colors.GREEN}[+] Token created and approved for {hostname}{Colors.RESET}")
-        print(f"{Colors.CYAN}    Token: {token}{Colors.RESET}")
-        print(f"{Colors.YELLOW}    Client should save this token to 'client_token.txt'{Colors.RESET}")
+        notify_token_decision(hostname)
+        print(f"{GREEN}[+] Token created and approved for {hostname}{RESET}")
+        print(f"{CYAN}    Token: {token}{RESET}")
+        print(f"{YELLOW}    Client should save this token to 'client_token.txt'{RESET}")
         logger.info(f"Token manually added for {hostname}")
     else:
-        print(f"{Colors.RED}[!] Failed to create token for {hostname}{Colors.RESET}")
+        print(f"{RED}[!] Failed to create token for {hostname}{RESET}")
+
+
+def _add_tokens(hostnames):
+    """Manually add and approve tokens for several hostnames in one database transaction"""
+    lines = []
+    for hostname, token in token_manager.bulk_add_tokens(hostnames):
+        notify_token_decision(hostname)
+        lines.append(f"{GREEN}[+] Token created and approved for {hostname}{RESET}")
+        lines.append(f"{CYAN}    Token: {token}{RESET}")
+        logger.info(f"Token manually added for {hostname}")
+    lines.append(f"{YELLOW}    Clients should save their token to 'client_token.txt'{RESET}")
+    _emit(lines)
 
 
 def delete_token(target):
@@ -414,43 +620,37 @@ def delete_token(target):
     token, status = token_manager.get_token_by_hostname(hostname)
 
     if not token:
-        print(f"{Colors.RED}[!] No token found for {target}{Colors.RESET}")
+        print(f"{RED}[!] No token found for {target}{RESET}")
         return
 
     # Confirm deletion
-    print(f"{Colors.YELLOW}⚠️  WARNING: This will permanently delete the token for {hostname}{Colors.RESET}")
+    print(f"{YELLOW}⚠️  WARNING: This will permanently delete the token for {hostname}{RESET}")
     print(f"    Status: {status}")
     confirm = input(f"    Type 'yes' to confirm deletion: ").strip().lower()
 
     if confirm != 'yes':
-        print(f"{Colors.YELLOW}[*] Deletion cancelled{Colors.RESET}")
+        print(f"{YELLOW}[*] Deletion cancelled{RESET}")
         return
 
     # Check if client is connected and kick them first
-    with clients_lock:
-        if hostname in clients:
-            client_info = clients[hostname]
-            client_socket = client_info['socket']
-            session_id = client_info['session_id']
+    client_info = get_clients().get(hostname)
 
-            try:
-                # Send deletion notice to client
-                from common.config import MSG_TOKEN_STATUS
-                send_message(client_socket, f"{MSG_TOKEN_STATUS}:deleted")
-                logger.info(f"[SESSION:{session_id}] Sent deletion notice to {hostname}")
-                print(f"{Colors.YELLOW}[*] Kicked {hostname} from server{Colors.RESET}")
-            except:
-                pass
+    if client_info:
+        # Send deletion notice to client without blocking the prompt
+        _notify_pool.submit(_safe_notify, client_info, hostname,
+                            f"{MSG_TOKEN_STATUS}:deleted", "deletion")
+        print(f"{YELLOW}[*] Kicked {hostname} from server{RESET}")
 
     # Delete token from database
     success = token_manager.delete_token(hostname)
 
     if success:
-        print(f"{Colors.GREEN}[+] Token permanently deleted for {hostname}{Colors.RESET}")
-        print(f"{Colors.YELLOW}[*] Client must request a new token to reconnect{Colors.RESET}")
+        notify_token_decision(hostname)
+        print(f"{GREEN}[+] Token permanently deleted for {hostname}{RESET}")
+        print(f"{YELLOW}[*] Client must request a new token to reconnect{RESET}")
         logger.info(f"Token deleted for {hostname}")
     else:
-        print(f"{Colors.RED}[!] Failed to delete token for {hostname}{Colors.RESET}")
+        print(f"{RED}[!] Failed to delete token for {hostname}{RESET}")
 
 
 def renew_token(target):
@@ -464,23 +664,24 @@ def renew_token(target):
     token, status = token_manager.get_token_by_hostname(hostname)
 
     if not token:
-        print(f"{Colors.RED}[!] No token found for {target}{Colors.RESET}")
+        print(f"{RED}[!] No token found for {target}{RESET}")
         return
 
     if status != 'revoked':
-        print(f"{Colors.YELLOW}[!] Token for {hostname} is not revoked (status: {status}){Colors.RESET}")
-        print(f"{Colors.YELLOW}[*] Only revoked tokens can be renewed{Colors.RESET}")
+        print(f"{YELLOW}[!] Token for {hostname} is not revoked (status: {status}){RESET}")
+        print(f"{YELLOW}[*] Only revoked tokens can be renewed{RESET}")
         return
 
     # Approve the existing token (change status from revoked to approved)
     success, _ = token_manager.approve_token(hostname)
 
     if success:
-        print(f"{Colors.GREEN}[+] Token renewed for {hostname}{Colors.RESET}")
-        print(f"{Colors.CYAN}[*] Client can reconnect with their existing token{Colors.RESET}")
+        notify_token_decision(hostname)
+        print(f"{GREEN}[+] Token renewed for {hostname}{RESET}")
+        print(f"{CYAN}[*] Client can reconnect with their existing token{RESET}")
         logger.info(f"Token renewed for {hostname}")
     else:
-        print(f"{Colors.RED}[!] Failed to renew token for {hostname}{Colors.RESET}")
+        print(f"{RED}[!] Failed to renew token for {hostname}{RESET}")
 
 
 def disambiguate_command(cmd, hostname):
@@ -506,15 +707,15 @@ def disambiguate_command(cmd, hostname):
 
     client_desc, server_desc = command_descriptions.get(cmd, ('run on client', 'run server command'))
 
-    print(f"\n{Colors.YELLOW}⚠️  Ambiguous command '{Colors.BOLD}{cmd}{Colors.RESET}{Colors.YELLOW}'{Colors.RESET}")
-    print(f"{Colors.CYAN}[1]{Colors.RESET} Run '{Colors.BOLD}{cmd}{Colors.RESET}' on client {Colors.GREEN}{hostname}{Colors.RESET} ({client_desc})")
-    print(f"{Colors.CYAN}[2]{Colors.RESET} Execute server command ({server_desc})")
-    print(f"{Colors.CYAN}[3]{Colors.RESET} Cancel")
+    print(f"\n{YELLOW}⚠️  Ambiguous command '{BOLD}{cmd}{RESET}{YELLOW}'{RESET}")
+    print(f"{CYAN}[1]{RESET} Run '{BOLD}{cmd}{RESET}' on client {GREEN}{hostname}{RESET} ({client_desc})")
+    print(f"{CYAN}[2]{RESET} Execute server command ({server_desc})")
+    print(f"{CYAN}[3]{RESET} Cancel")
     print()
 
     while True:
         try:
-            choice = input(f"{Colors.BOLD}Choice (1/2/3):{Colors.RESET} ").strip()
+            choice = input(f"{BOLD}Choice (1/2/3):{RESET} ").strip()
 
             if choice == '1':
                 return 'client'
@@ -523,7 +724,7 @@ def disambiguate_command(cmd, hostname):
             elif choice == '3':
                 return 'cancel'
             else:
-                print(f"{Colors.RED}Invalid choice. Please enter 1, 2, or 3{Colors.RESET}")
+                print(f"{RED}Invalid choice. Please enter 1, 2, or 3{RESET}")
         except (KeyboardInterrupt, EOFError):
             print()
             return 'cancel'
@@ -531,65 +732,207 @@ def disambiguate_command(cmd, hostname):
 
 def display_command_output(hostname, stdout, stderr):
     """Display command results with colored formatting"""
-    print(f"\n{Colors.CYAN}{'='*50}{Colors.RESET}")
-    print(f"{Colors.BOLD}Output from {hostname}{Colors.RESET}")
-    print(f"{Colors.CYAN}{'='*50}{Colors.RESET}")
+    lines = [
+        f"\n{CYAN}{_EQ50}{RESET}",
+        f"{BOLD}Output from {hostname}{RESET}",
+        f"{CYAN}{_EQ50}{RESET}",
+    ]
     if stdout:
-        print(f"{Colors.GREEN}STDOUT:{Colors.RESET}")
-        print(stdout)
+        lines.append(f"{GREEN}STDOUT:{RESET}")
+        lines.append(stdout)
     if stderr:
-        print(f"{Colors.RED}STDERR:{Colors.RESET}")
-        print(stderr)
-    print(f"{Colors.CYAN}{'='*50}{Colors.RESET}\n")
+        lines.append(f"{RED}STDERR:{RESET}")
+        lines.append(stderr)
+    lines.append(f"{CYAN}{_EQ50}{RESET}\n")
+
+    _emit(lines)
+
+
+def use_session(target):
+    """Open an interactive session with a client (supports number or hostname)"""
+    global active_session
+
+    # Try to resolve as number first, then as hostname
+    hostname = get_hostname_by_number(target)
+    if not hostname:
+        hostname = target  # Treat as hostname
+
+    clients = get_clients()
+    if hostname in clients:
+        # Check if already in this session
+        if active_session == hostname:
+            print(f"{YELLOW}[*] Already in session with {hostname}{RESET}")
+        else:
+            # Check if switching from another session
+            if active_session:
+                old_session = active_session
+                if old_session in clients:
+                    old_session_id = clients[old_session]['session_id']
+                    logger.info(f"[SESSION:{old_session_id}] Session closed: {old_session}")
+                    print(f"{YELLOW}[*] Closed session with {old_session}{RESET}")
+
+            # Open new session
+            active_session = hostname
+            session_id = clients[hostname]['session_id']
+            logger.info(f"[SESSION:{session_id}] Session opened: {hostname}")
+            print(f"{GREEN}[+] Session opened with {hostname}{RESET}")
+    else:
+        print(f"{RED}[!] Client '{target}' not found{RESET}")
+
+
+# Commands that could be meant for the server OR the active client
+AMBIGUOUS_COMMANDS = frozenset({'list', 'sessions', 'help', '?', 'pending', 'tokens'})
+
+# Leave the session (or shut down when not in one) / leave the session only
+_EXIT_CMDS = frozenset({'exit', 'quit'})
+_BACK_CMDS = frozenset({'back', 'q'})
+
+# Server commands taking no argument: exact command -> handler
+_NOARG_HANDLERS = {
+    'list': list_clients,
+    'sessions': list_clients,
+    'pending': list_pending_requests,
+    'tokens': list_all_tokens,
+    'help': show_help,
+    '?': show_help,
+}
+
+# Server commands taking a target: verb -> handler(arg)
+_VERB_HANDLERS = {
+    'approve': approve_token,
+    'deny': deny_token,
+    'revoke': revoke_token,
+    'addtoken': add_token_manual,
+    'delete': delete_token,
+    'renew': renew_token,
+    'use': use_session,
+}
+
+# Every first word the CLI understands, for tab completion
+_COMMAND_NAMES = sorted({*_NOARG_HANDLERS, *_VERB_HANDLERS, *_EXIT_CMDS, *_BACK_CMDS})
+
+
+def _complete_command(text, state):
+    """readline completer: complete the first word against known server commands"""
+    if ' ' in readline.get_line_buffer().lstrip():
+        return None
+    matches = [cmd for cmd in _COMMAND_NAMES if cmd.startswith(text)]
+    return matches[state] if state < len(matches) else None
+
+
+def _run_on_client(cmd):
+    """Run a command on the active session's client and show the result"""
+    global active_session
+
+    stdout, stderr = send_command_to_client(active_session, cmd)
+
+    if stdout is None:
+        print(f"{RED}[!] {stderr}{RESET}")
+        # Check if client disconnected
+        if stderr and "disconnected" in stderr.lower():
+            logger.warning(f"Session closed: {active_session} (client disconnected)")
+            active_session = None
+    else:
+        display_command_output(active_session, stdout, stderr)
+
+
+def _route_session_command(cmd, verb, sep):
+    """
+    Handle a command entered while a session is active
+
+    Args:
+        cmd: Full command line
+        verb: First word of the command
+        sep: ' ' if the command has an argument, else ''
+
+    Returns:
+        bool: True if the caller should execute it as a server command
+    """
+    # Ambiguous commands - ask the operator where it should run
+    if cmd in AMBIGUOUS_COMMANDS:
+        choice = disambiguate_command(cmd if cmd != '?' else 'help', active_session)
+
+        if choice == 'server':
+            return True
+        if choice == 'client':
+            _run_on_client(cmd)
+        return False
+
+    # Server commands that take an argument (like 'use ', 'approve ', etc.)
+    if sep and verb in _VERB_HANDLERS:
+        return True
+
+    # Not ambiguous, not a server command - send to client
+    _run_on_client(cmd)
+    return False
+
+
+def setup_readline():
+    """Enable persistent command history and tab completion if readline is available"""
+    if readline is None:
+        return
+
+    history_file = os.path.expanduser(CLI_HISTORY_FILE)
+    readline.set_history_length(CLI_HISTORY_LENGTH)
+    try:
+        readline.read_history_file(history_file)
+    except OSError:
+        pass  # No history yet
+    atexit.register(readline.write_history_file, history_file)
+
+    readline.set_completer(_complete_command)
+    readline.parse_and_bind('tab: complete')
 
 
 def operator_cli():
     """Interactive CLI for operator"""
     global active_session
 
-    print(f"\n{Colors.GREEN}{Colors.BOLD}{'='*70}{Colors.RESET}")
-    print(f"{Colors.GREEN}{Colors.BOLD}  🎯 C2 OPERATOR CONSOLE - READY{Colors.RESET}")
-    print(f"{Colors.GREEN}{Colors.BOLD}{'='*70}{Colors.RESET}\n")
+    setup_readline()
 
-    print(f"{Colors.CYAN}Welcome! The C2 server is now running.{Colors.RESET}")
-    print(f"{Colors.CYAN}Waiting for clients to connect...{Colors.RESET}\n")
+    print(f"\n{GREEN}{BOLD}{_EQ70}{RESET}")
+    print(f"{GREEN}{BOLD}  🎯 C2 OPERATOR CONSOLE - READY{RESET}")
+    print(f"{GREEN}{BOLD}{_EQ70}{RESET}\n")
 
-    print(f"{Colors.YELLOW}Quick Start:{Colors.RESET}")
-    print(f"  • Type {Colors.BOLD}help{Colors.RESET} to see all commands")
-    print(f"  • Type {Colors.BOLD}list{Colors.RESET} to check system status")
+    print(f"{CYAN}Welcome! The C2 server is now running.{RESET}")
+    print(f"{CYAN}Waiting for clients to connect...{RESET}\n")
+
+    print(f"{YELLOW}Quick Start:{RESET}")
+    print(f"  • Type {BOLD}help{RESET} to see all commands")
+    print(f"  • Type {BOLD}list{RESET} to check system status")
     print(f"  • When a client connects, you'll see a notification!")
 
-    print(f"\n{Colors.GREEN}{Colors.BOLD}{'='*70}{Colors.RESET}\n")
+    print(f"\n{GREEN}{BOLD}{_EQ70}{RESET}\n")
 
     while True:
         try:
             # Build prompt with pending count
-            pending_count = len(token_manager.get_pending_requests())
+            pending_count = _pending_count()
             if active_session:
                 if pending_count > 0:
-                    prompt = f"{Colors.MAGENTA}[{active_session}]{Colors.RESET} {Colors.YELLOW}({pending_count} pending){Colors.RESET} > "
+                    prompt = f"{MAGENTA}[{active_session}]{RESET} {YELLOW}({pending_count} pending){RESET} > "
                 else:
-                    prompt = f"{Colors.MAGENTA}[{active_session}]{Colors.RESET}> "
+                    prompt = f"{MAGENTA}[{active_session}]{RESET}> "
             else:
                 if pending_count > 0:
-                    prompt = f"{Colors.BOLD}c2{Colors.RESET} {Colors.YELLOW}({pending_count} pending){Colors.RESET} > "
+                    prompt = f"{BOLD}c2{RESET} {YELLOW}({pending_count} pending){RESET} > "
                 else:
-                    prompt = f"{Colors.BOLD}c2{Colors.RESET}> "
+                    prompt = f"{BOLD}c2{RESET}> "
 
             cmd = input(prompt).strip()
 
             if not cmd:
                 continue
 
-            # Define ambiguous commands (could be for server OR client)
-            AMBIGUOUS_COMMANDS = ['list', 'sessions', 'help', 'pending', 'tokens']
+            # Split once: verb plus optional argument
+            verb, sep, arg = cmd.partition(' ')
 
             # Clear exit commands - handle immediately without prompting
-            if cmd in ['exit', 'quit']:
+            if cmd in _EXIT_CMDS:
                 if active_session:
                     # In session, exit means exit session
                     logger.info(f"Session closed: {active_session}")
-                    print(f"{Colors.YELLOW}[*] Session closed{Colors.RESET}")
+                    print(f"{YELLOW}[*] Session closed{RESET}")
                     active_session = None
                 else:
                     # Not in session, exit means shutdown
@@ -597,137 +940,37 @@ def operator_cli():
                     sys.exit(0)
                 continue
 
-            elif cmd in ['back', 'q']:
+            elif cmd in _BACK_CMDS:
                 if active_session:
-                    with clients_lock:
-                        if active_session in clients:
-                            session_id = clients[active_session]['session_id']
-                            logger.info(f"[SESSION:{session_id}] Session closed: {active_session}")
-                        else:
-                            logger.info(f"Session closed: {active_session}")
-                    print(f"{Colors.YELLOW}[*] Session closed{Colors.RESET}")
+                    client_info = get_clients().get(active_session)
+                    if client_info:
+                        logger.info(f"[SESSION:{client_info['session_id']}] Session closed: {active_session}")
+                    else:
+                        logger.info(f"Session closed: {active_session}")
+                    print(f"{YELLOW}[*] Session closed{RESET}")
                     active_session = None
                 else:
-                    print(f"{Colors.RED}[!] No active session{Colors.RESET}")
+                    print(f"{RED}[!] No active session{RESET}")
                 continue
 
-            # If in a session, check for ambiguous commands
-            if active_session:
-                # Check if this is an ambiguous command
-                if cmd in AMBIGUOUS_COMMANDS or cmd == '?':
-                    # Ask user what they want to do
-                    choice = disambiguate_command(cmd if cmd != '?' else 'help', active_session)
-
-                    if choice == 'cancel':
-                        continue
-                    elif choice == 'client':
-                        # Send to client
-                        stdout, stderr = send_command_to_client(active_session, cmd)
-
-                        if stdout is None:
-                            print(f"{Colors.RED}[!] {stderr}{Colors.RESET}")
-                            # Check if client disconnected
-                            if stderr and "disconnected" in stderr.lower():
-                                logger.warning(f"Session closed: {active_session} (client disconnected)")
-                                active_session = None
-                        else:
-                            display_command_output(active_session, stdout, stderr)
-                        continue
-                    # If choice == 'server', fall through to execute server command below
-
-                # Check for commands that start with prefixes (like 'use ', 'approve ', etc.)
-                elif cmd.startswith(('use ', 'approve ', 'deny ', 'revoke ', 'addtoken ', 'delete ', 'renew ')):
-                    # These are clearly server commands, execute them
-                    pass  # Fall through to server command handling
-
-                else:
-                    # Not ambiguous, not a server command - send to client
-                    stdout, stderr = send_command_to_client(active_session, cmd)
-
-                    if stdout is None:
-                        print(f"{Colors.RED}[!] {stderr}{Colors.RESET}")
-                        # Check if client disconnected
-                        if stderr and "disconnected" in stderr.lower():
-                            logger.warning(f"Session closed: {active_session} (client disconnected)")
-                            active_session = None
-                    else:
-                        display_command_output(active_session, stdout, stderr)
-                    continue
+            # In a session: send to client unless it's meant for the server
+            if active_session and not _route_session_command(cmd, verb, sep):
+                continue
 
             # Server commands (executed when NOT in session, or when user chose 'server' option)
-            if cmd in ['list', 'sessions']:
-                list_clients()
-
-            elif cmd == 'pending':
-                list_pending_requests()
-
-            elif cmd == 'tokens':
-                list_all_tokens()
-
-            elif cmd.startswith('approve '):
-                hostname = cmd.split(' ', 1)[1].strip()
-                approve_token(hostname)
-
-            elif cmd.startswith('deny '):
-                hostname = cmd.split(' ', 1)[1].strip()
-                deny_token(hostname)
-
-            elif cmd.startswith('revoke '):
-                hostname = cmd.split(' ', 1)[1].strip()
-                revoke_token(hostname)
-
-            elif cmd.startswith('addtoken '):
-                hostname = cmd.split(' ', 1)[1].strip()
-                add_token_manual(hostname)
-
-            elif cmd.startswith('delete '):
-                hostname = cmd.split(' ', 1)[1].strip()
-                delete_token(hostname)
-
-            elif cmd.startswith('renew '):
-                hostname = cmd.split(' ', 1)[1].strip()
-                renew_token(hostname)
-
-            elif cmd in ['help', '?']:
-                show_help()
-
-            elif cmd.startswith('use '):
-                target = cmd.split(' ', 1)[1].strip()
-
-                # Try to resolve as number first, then as hostname
-                hostname = get_hostname_by_number(target)
-                if not hostname:
-                    hostname = target  # Treat as hostname
-
-                with clients_lock:
-                    if hostname in clients:
-                        # Check if already in this session
-                        if active_session == hostname:
-                            print(f"{Colors.YELLOW}[*] Already in session with {hostname}{Colors.RESET}")
-                        else:
-                            # Check if switching from another session
-                            if active_session:
-                                old_session = active_session
-                                if old_session in clients:
-                                    old_session_id = clients[old_session]['session_id']
-                                    logger.info(f"[SESSION:{old_session_id}] Session closed: {old_session}")
-                                    print(f"{Colors.YELLOW}[*] Closed session with {old_session}{Colors.RESET}")
-
-                            # Open new session
-                            active_session = hostname
-                            session_id = clients[hostname]['session_id']
-                            logger.info(f"[SESSION:{session_id}] Session opened: {hostname}")
-                            print(f"{Colors.GREEN}[+] Session opened with {hostname}{Colors.RESET}")
-                    else:
-                        print(f"{Colors.RED}[!] Client '{target}' not found{Colors.RESET}")
+            handler = _VERB_HANDLERS.get(verb) if sep else _NOARG_HANDLERS.get(cmd)
 
+            if handler and sep:
+                handler(arg.strip())
+            elif handler:
+                handler()
             else:
-                print(f"{Colors.RED}[!] Unknown command{Colors.RESET}")
+                print(f"{RED}[!] Unknown command{RESET}")
 
         except KeyboardInterrupt:
-            print(f"\n{Colors.YELLOW}Use 'exit' to quit{Colors.RESET}")
+            print(f"\n{YELLOW}Use 'exit' to quit{RESET}")
         except EOFError:
             break
         except Exception as e:
             logger.error(f"CLI error: {e}")
-            print(f"{Colors.RED}[!] Error: {e}{Colors.RESET}")
+            print(f"{RED}[!] Error: {e}{RESET}")
@@ -3,19 +3,20 @@ Client Handler Module
 Manages individual client connections and command/response communication
 """
 
+import re
 import socket
 import threading
 import time
 import uuid
 import secrets
-from common.protocol import send_message, recv_message
+from common.protocol import send_message, send_message_parts, recv_message, enable_keepalive
 from common.config import (
-    SOCKET_TIMEOUT,
-    MSG_REGISTER, MSG_CMD, MSG_RESULT, MSG_TOKEN_REQUEST, MSG_TOKEN_STATUS,
+    SOCKET_TIMEOUT, MAX_MESSAGE_SIZE, TOKEN_POLL_INTERVAL, TOKEN_KEEPALIVE_IDLE, TOKEN_ALERT_COALESCE,
+    MSG_REGISTER, MSG_TOKEN_REQUEST, MSG_CMD_B, MSG_RESULT_B, MSG_RESULT_CHUNK_B, MSG_TOKEN_STATUS_B,
     TOKEN_PENDING, TOKEN_APPROVED, TOKEN_DENIED, TOKEN_REVOKED, TOKEN_INVALID
 )
-from common.auth import hash_token
 from server.logger_config import logger
+from server.notifications import notify
 from server import token_manager
 
 
@@ -33,30 +34,137 @@ class _Colors:
 Colors = _Colors()
 
 
-# Global client registry (authenticated clients only)
-clients = {}  # {hostname: {session_id, socket, address, thread, lock}}
-clients_lock = threading.Lock()
-
-# Pending token request connections (waiting for approval)
-pending_clients = {}  # {hostname: {socket, address, session_id}}
+# Operator alerts - colors resolved once at import, per-event values filled by format()
+_CONNECT_BANNER = "\n".join([
+    f"\n{Colors.GREEN}{Colors.BOLD}{'='*70}{Colors.RESET}",
+    f"{Colors.GREEN}{Colors.BOLD}  ✅ CLIENT CONNECTED!{Colors.RESET}",
+    f"{Colors.GREEN}{Colors.BOLD}{'='*70}{Colors.RESET}",
+    f"{Colors.CYAN}   Hostname: {Colors.BOLD}{{hostname}}{Colors.RESET}",
+    f"{Colors.CYAN}   Session ID: {Colors.BOLD}{{session_id}}{Colors.RESET}",
+    f"{Colors.CYAN}   IP Address: {Colors.BOLD}{{ip}}{Colors.RESET}",
+    f"\n{Colors.YELLOW}   Quick Action:{Colors.RESET}",
+    f"   → Type: {Colors.BOLD}use {{hostname}}{Colors.RESET} or {Colors.BOLD}use {{num}}{Colors.RESET} to interact",
+    f"   → Or use: {Colors.BOLD}list{Colors.RESET} to see all clients",
+    f"{Colors.GREEN}{Colors.BOLD}{'='*70}{Colors.RESET}\n",
+])
+
+_TOKEN_REQUEST_BANNER = "\n".join([
+    f"\n{Colors.YELLOW}{Colors.BOLD}{'='*70}{Colors.RESET}",
+    f"{Colors.YELLOW}{Colors.BOLD}  🔔 NEW TOKEN REQUEST!{Colors.RESET}",
+    f"{Colors.YELLOW}{Colors.BOLD}{'='*70}{Colors.RESET}",
+    f"{Colors.CYAN}   Hostname: {Colors.BOLD}{{hostname}}{Colors.RESET}",
+    f"{Colors.CYAN}   IP Address: {Colors.BOLD}{{ip}}{Colors.RESET}",
+    f"\n{Colors.GREEN}   Quick Action:{Colors.RESET}",
+    f"   → Type: {Colors.BOLD}approve {{hostname}}{Colors.RESET}",
+    f"   → Or use: {Colors.BOLD}pending{Colors.RESET} to see all requests",
+    f"{Colors.YELLOW}{Colors.BOLD}{'='*70}{Colors.RESET}\n",
+])
+
+_DISCONNECT_BANNER = "\n".join([
+    f"\n{Colors.RED}{Colors.BOLD}{'='*60}{Colors.RESET}",
+    f"{Colors.RED}{Colors.BOLD}  ⚠️  CLIENT DISCONNECTED{Colors.RESET}",
+    f"{Colors.RED}{Colors.BOLD}{'='*60}{Colors.RESET}",
+    f"{Colors.CYAN}   Hostname: {Colors.BOLD}{{hostname}}{Colors.RESET}",
+    f"{Colors.CYAN}   Reason: {Colors.BOLD}{{reason}}{Colors.RESET}",
+    f"{Colors.CYAN}   Session ID: {Colors.BOLD}{{session_id}}{Colors.RESET}",
+    f"{Colors.RED}{Colors.BOLD}{'='*60}{Colors.RESET}\n",
+])
+
+
+# First-message parsers, compiled once: REGISTER:hostname:token and TOKEN_REQUEST:hostname[:ip]
+_REGISTER_RE = re.compile(re.escape(MSG_REGISTER) + r':([^:]*):(.*)', re.DOTALL)
+_TOKEN_REQUEST_RE = re.compile(re.escape(MSG_TOKEN_REQUEST) + r':([^:]*)(?::(.*))?', re.DOTALL)
+
+# Fixed TOKEN_STATUS replies, encoded once
+_STATUS_MESSAGES = {
+    status: b':'.join([MSG_TOKEN_STATUS_B, status.encode()])
+    for status in (TOKEN_PENDING, TOKEN_APPROVED, TOKEN_DENIED, TOKEN_REVOKED, TOKEN_INVALID)
+}
+
+# Fixed message prefixes - sent as their own buffer ahead of the variable part
+_CMD_PREFIX = MSG_CMD_B + b':'
+_APPROVED_PREFIX = _STATUS_MESSAGES[TOKEN_APPROVED] + b':'
+
+
+# Global client registry (authenticated clients only) - copy-on-write.
+# Writers build a new dict under clients_lock and swap the reference in;
+# readers take the current reference (get_clients) without locking.
+clients = {}  # {hostname: {session_id, socket, address, lock}}
+client_index = {}  # {number: hostname} - display numbers, swapped together with clients
+clients_lock = threading.Lock()  # Serializes writers only
+
+# Hostnames the operator has decided on that parked token requests haven't been told about yet
+decided_tokens = set()
 pending_clients_lock = threading.Lock()
 
+# Called after a decision is recorded so the listener wakes up and pushes it (set by the listener)
+_decision_wakeup = None
+
+# When each hostname last raised a token request alert - a client retrying in a
+# loop gets one alert per TOKEN_ALERT_COALESCE window instead of one per attempt
+_recent_token_alerts = {}  # {hostname: monotonic time}
+_recent_token_alerts_lock = threading.Lock()
+_RECENT_ALERTS_PRUNE = 5  # Seconds between sweeps of stale entries
+_next_alerts_prune = 0.0
+
+
+def _swap_clients(new_clients):
+    """
+    Publish a new client registry and its number index (call with clients_lock held)
+
+    Args:
+        new_clients: Replacement {hostname: info_dict} - not modified afterwards
+    """
+    global clients, client_index
+    client_index = dict(enumerate(new_clients, 1))
+    clients = new_clients
+
+
+def _should_alert_token_request(hostname):
+    """
+    Decide whether a token request from hostname deserves an operator alert
+
+    Returns:
+        bool: False if the same hostname already raised one within TOKEN_ALERT_COALESCE
+    """
+    global _next_alerts_prune
+    now = time.monotonic()
+    with _recent_token_alerts_lock:
+        last = _recent_token_alerts.get(hostname)
+        if last is not None and now - last < TOKEN_ALERT_COALESCE:
+            return False
+        _recent_token_alerts[hostname] = now
+
+        if now >= _next_alerts_prune:
+            _next_alerts_prune = now + _RECENT_ALERTS_PRUNE
+            stale = [host for host, seen in _recent_token_alerts.items()
+                     if now - seen >= _RECENT_ALERTS_PRUNE]
+            for host in stale:
+                del _recent_token_alerts[host]
+        return True
+
 
 def handle_client(client_socket, client_address):
     """
-    Handle individual client connection lifecycle
+    Handle a new client connection up to the point where it can be parked
+
+    Runs on a listener worker thread. Registered clients stay in the clients
+    registry (the CLI thread drives them from then on), and token requests
+    still waiting for the operator are handed back to the listener to park
+    until a decision is made - neither keeps a thread.
 
     Args:
         client_socket: Connected socket object
         client_address: Tuple of (IP, port)
+
+    Returns:
+        dict: Pending token request to park, or None when the connection needs no more work
     """
     # Generate unique session ID
     session_id = str(uuid.uuid4())[:8]
 
     logger.info(f"[SESSION:{session_id}] Client connected: {client_address[0]}:{client_address[1]}")
 
-    hostname = None
-
     try:
         # Wait for first message (either REGISTER or TOKEN_REQUEST)
         first_message = recv_message(client_socket)
@@ -64,44 +172,79 @@ def handle_client(client_socket, client_address):
         if not first_message:
             logger.warning(f"[SESSION:{session_id}] No message from {client_address}")
             client_socket.close()
-            return
+            return None
+
+        # The handshake timeout only covers the first message
+        client_socket.settimeout(None)
 
         # Handle token request
         if first_message.startswith(MSG_TOKEN_REQUEST):
-            handle_token_request(client_socket, client_address, session_id, first_message)
-            return
+            return handle_token_request(client_socket, client_address, session_id, first_message)
 
         # Handle registration
         if first_message.startswith(MSG_REGISTER):
             hostname = handle_registration(client_socket, client_address, session_id, first_message)
-            if not hostname:
-                return
-
-            # Registration successful - keep connection alive
-            logger.info(f"[SESSION:{session_id}] Client authenticated: {hostname}")
-
-            # Keep thread alive - socket managed by CLI thread
-            while True:
-                time.sleep(60)
+            if hostname:
+                # Registration successful - socket is now managed by the CLI thread
+                logger.info(f"[SESSION:{session_id}] Client authenticated: {hostname}")
+            return None
 
-        else:
-            logger.warning(f"[SESSION:{session_id}] Invalid message type from {client_address}")
-            client_socket.close()
-            return
+        logger.warning(f"[SESSION:{session_id}] Invalid message type from {client_address}")
+        client_socket.close()
+        return None
 
     except Exception as e:
-        logger.error(f"[SESSION:{session_id}] Error handling client {hostname or client_address}: {e}")
-    finally:
-        # Cleanup on disconnection or error
-        with clients_lock:
-            if hostname and hostname in clients:
-                del clients[hostname]
-                logger.info(f"[SESSION:{session_id}] Client disconnected: {hostname}")
-
+        logger.error(f"[SESSION:{session_id}] Error handling client {client_address}: {e}")
         try:
             client_socket.close()
         except:
             pass
+        return None
+
+
+def _reject_registration(client_socket, status):
+    """Send a TOKEN_STATUS rejection (best effort) and close the connection"""
+    try:
+        send_message(client_socket, _STATUS_MESSAGES[status])
+    except:
+        pass
+    client_socket.close()
+
+
+def _check_rejected_token(client_socket, client_address, session_id, hostname, client_token):
+    """
+    Re-check a token that failed validation and tell the client why it was rejected
+
+    Returns:
+        bool: True if the token was approved since the first check (proceed),
+              False if the client was rejected and its socket closed
+    """
+    stored_token, token_status = token_manager.get_token_by_hostname(hostname)
+
+    if not stored_token:
+        logger.warning(f"[SESSION:{session_id}] No token found for {hostname} from {client_address[0]}")
+        _reject_registration(client_socket, TOKEN_INVALID)
+        return False
+
+    # Constant-time compare on raw bytes (str would reject non-ASCII input with TypeError)
+    if not secrets.compare_digest(stored_token.encode(), client_token.encode()):
+        logger.warning(f"[SESSION:{session_id}] Invalid token for {hostname} from {client_address[0]}")
+        _reject_registration(client_socket, TOKEN_INVALID)
+        return False
+
+    if token_status == 'revoked':
+        # Send revoked status (not invalid)
+        logger.warning(f"[SESSION:{session_id}] Revoked token used by {hostname} from {client_address[0]}")
+        _reject_registration(client_socket, TOKEN_REVOKED)
+        return False
+
+    if token_status != 'approved':
+        # Token exists but not approved (pending, denied, etc.)
+        logger.warning(f"[SESSION:{session_id}] Non-approved token ({token_status}) used by {hostname}")
+        _reject_registration(client_socket, TOKEN_INVALID)
+        return False
+
+    return True
 
 
 def handle_registration(client_socket, client_address, session_id, reg_message):
@@ -112,146 +255,80 @@ def handle_registration(client_socket, client_address, session_id, reg_message):
         str: hostname if successful, None otherwise
     """
     # Parse registration: REGISTER:hostname:token
-    parts = reg_message.split(':', 2)
-    if len(parts) != 3:
+    match = _REGISTER_RE.fullmatch(reg_message)
+    if not match:
         logger.warning(f"[SESSION:{session_id}] Invalid registration format from {client_address}")
         client_socket.close()
         return None
 
-    hostname = parts[1]
-    client_token = parts[2]
+    hostname, client_token = match.groups()
 
-    # Check token status first
-    stored_token, token_status = token_manager.get_token_by_hostname(hostname)
-
-    # If token exists and matches, check status
-    if stored_token and token_status:
-        if secrets.compare_digest(stored_token, client_token):
-            # Token matches, check status
-            if token_status == 'revoked':
-                logger.warning(f"[SESSION:{session_id}] Revoked token used by {hostname} from {client_address[0]}")
-
-                # Send revoked status (not invalid)
-                try:
-                    send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_REVOKED}")
-                except:
-                    pass
-
-                client_socket.close()
-                return None
-            elif token_status == 'approved':
-                # Token is valid, proceed with registration
-                pass
-            else:
-                # Token exists but not approved (pending, denied, etc.)
-                logger.warning(f"[SESSION:{session_id}] Non-approved token ({token_status}) used by {hostname}")
-                try:
-                    send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_INVALID}")
-                except:
-                    pass
-
-                client_socket.close()
-                return None
-        else:
-            # Token doesn't match
-            logger.warning(f"[SESSION:{session_id}] Invalid token for {hostname} from {client_address[0]}")
-            try:
-                send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_INVALID}")
-            except:
-                pass
-
-            client_socket.close()
+    # Fast path: approved and matching - usually answered from the validation
+    # cache without touching SQLite. Anything else gets the detailed check.
+    if not token_manager.validate_client_token(hostname, client_token):
+        if not _check_rejected_token(client_socket, client_address, session_id, hostname, client_token):
             return None
-    else:
-        # No token found for hostname
-        logger.warning(f"[SESSION:{session_id}] No token found for {hostname} from {client_address[0]}")
-        try:
-            send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_INVALID}")
-        except:
-            pass
-
-        client_socket.close()
-        return None
 
     logger.info(f"[SESSION:{session_id}] Client authenticated: {hostname} from {client_address[0]}")
 
     # Send explicit TOKEN_APPROVED message to client
     # This MUST be sent before any other operations
     try:
-        send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_APPROVED}")
+        send_message(client_socket, _STATUS_MESSAGES[TOKEN_APPROVED])
         logger.debug(f"[SESSION:{session_id}] Sent TOKEN_APPROVED message to {hostname}")
     except Exception as e:
         logger.error(f"[SESSION:{session_id}] Failed to send TOKEN_APPROVED to {hostname}: {e}")
         client_socket.close()
         return None
 
-    # Check for duplicate hostname
+    client_info = {
+        'session_id': session_id,
+        'socket': client_socket,
+        'address': client_address,
+        'lock': threading.Lock()  # Per-client socket lock
+    }
+
     with clients_lock:
+        # Check for duplicate hostname
         if hostname in clients:
             old_session = clients[hostname]['session_id']
             logger.warning(f"[SESSION:{session_id}] Duplicate hostname '{hostname}' - overwriting session {old_session}")
 
-        clients[hostname] = {
-            'session_id': session_id,
-            'socket': client_socket,
-            'address': client_address,
-            'thread': threading.current_thread(),
-            'lock': threading.Lock()  # Per-client socket lock
-        }
+        _swap_clients({**clients, hostname: client_info})
 
-    # Get client number for display
-    with clients_lock:
+        # Get client number for display
         client_number = len(clients)
 
     # Notify operator with visual alert
-    print(f"\n{Colors.GREEN}{Colors.BOLD}{'='*70}{Colors.RESET}")
-    print(f"{Colors.GREEN}{Colors.BOLD}  ✅ CLIENT CONNECTED!{Colors.RESET}")
-    print(f"{Colors.GREEN}{Colors.BOLD}{'='*70}{Colors.RESET}")
-    print(f"{Colors.CYAN}   Hostname: {Colors.BOLD}{hostname}{Colors.RESET}")
-    print(f"{Colors.CYAN}   Session ID: {Colors.BOLD}{session_id}{Colors.RESET}")
-    print(f"{Colors.CYAN}   IP Address: {Colors.BOLD}{client_address[0]}{Colors.RESET}")
-    print(f"\n{Colors.YELLOW}   Quick Action:{Colors.RESET}")
-    print(f"   → Type: {Colors.BOLD}use {hostname}{Colors.RESET} or {Colors.BOLD}use {client_number}{Colors.RESET} to interact")
-    print(f"   → Or use: {Colors.BOLD}list{Colors.RESET} to see all clients")
-    print(f"{Colors.GREEN}{Colors.BOLD}{'='*70}{Colors.RESET}\n")
+    notify([_CONNECT_BANNER.format(hostname=hostname, session_id=session_id,
+                                   ip=client_address[0], num=client_number)])
 
     return hostname
 
 
 def handle_token_request(client_socket, client_address, session_id, request_message):
     """
-    Handle token request from client and keep connection alive for polling
+    Handle token request from client and keep connection alive until decided
 
     Args:
         client_socket: Connected socket
         client_address: Client address tuple
         session_id: Session ID
         request_message: TOKEN_REQUEST message
+
+    Returns:
+        dict: Pending token request to park until decided, or None if already answered
     """
-    # Parse: TOKEN_REQUEST:hostname:ip
-    parts = request_message.split(':', 2)
-    if len(parts) < 2:
+    # Parse: TOKEN_REQUEST:hostname:ip (ip optional)
+    match = _TOKEN_REQUEST_RE.fullmatch(request_message)
+    if not match:
         logger.warning(f"[SESSION:{session_id}] Invalid token request format from {client_address}")
         client_socket.close()
-        return
-
-    hostname = parts[1]
-    ip_address = client_address[0] if len(parts) < 3 else parts[2]
+        return None
 
-    # Check if this is a status check (polling for approval)
-    if len(parts) > 2 and parts[2] == 'status_check':
-        # Client is polling for status update
-        token, status = token_manager.get_token_by_hostname(hostname)
-
-        if status == TOKEN_APPROVED:
-            send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_APPROVED}:{token}")
-        elif status == TOKEN_DENIED:
-            send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_DENIED}")
-        elif status == TOKEN_PENDING:
-            send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_PENDING}")
-        else:
-            send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_INVALID}")
-        return
+    hostname, ip_address = match.groups()
+    if ip_address is None:
+        ip_address = client_address[0]
 
     logger.info(f"[SESSION:{session_id}] Token request from {hostname} ({ip_address})")
 
@@ -260,78 +337,158 @@ def handle_token_request(client_socket, client_address, session_id, request_mess
 
     if not success:
         logger.error(f"[SESSION:{session_id}] Failed to create token request for {hostname}")
-        send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_INVALID}")
+        send_message(client_socket, _STATUS_MESSAGES[TOKEN_INVALID])
         client_socket.close()
-        return
+        return None
 
     # Send status to client
     if status == TOKEN_APPROVED:
         # Already approved - send token immediately
         logger.info(f"[SESSION:{session_id}] Token already approved for {hostname}")
-        send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_APPROVED}:{token}")
+        send_message_parts(client_socket, [_APPROVED_PREFIX, token.encode()])
+        client_socket.close()
+        return None
 
     elif status == TOKEN_PENDING:
         # New or updated pending request
         logger.info(f"[SESSION:{session_id}] Token request pending for {hostname}")
 
         # Send pending status
-        send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_PENDING}")
-
-        # Display visual notification to operator
-        print(f"\n{Colors.YELLOW}{Colors.BOLD}{'='*70}{Colors.RESET}")
-        print(f"{Colors.YELLOW}{Colors.BOLD}  🔔 NEW TOKEN REQUEST!{Colors.RESET}")
-        print(f"{Colors.YELLOW}{Colors.BOLD}{'='*70}{Colors.RESET}")
-        print(f"{Colors.CYAN}   Hostname: {Colors.BOLD}{hostname}{Colors.RESET}")
-        print(f"{Colors.CYAN}   IP Address: {Colors.BOLD}{ip_address}{Colors.RESET}")
-        print(f"\n{Colors.GREEN}   Quick Action:{Colors.RESET}")
-        print(f"   → Type: {Colors.BOLD}approve {hostname}{Colors.RESET}")
-        print(f"   → Or use: {Colors.BOLD}pending{Colors.RESET} to see all requests")
-        print(f"{Colors.YELLOW}{Colors.BOLD}{'='*70}{Colors.RESET}\n")
-
-    # Keep connection alive and handle polling
-    # This loop will process status check requests until client disconnects
+        send_message(client_socket, _STATUS_MESSAGES[TOKEN_PENDING])
+
+        # Display visual notification to operator (retry storms coalesce to one)
+        if _should_alert_token_request(hostname):
+            notify([_TOKEN_REQUEST_BANNER.format(hostname=hostname, ip=ip_address)])
+
+    # Keep the connection open so the operator's decision can be pushed to it.
+    # It is parked in the listener's selector rather than a thread, and TCP
+    # keepalive (not app-level pings) detects a client that went away.
+    enable_keepalive(client_socket, idle=TOKEN_KEEPALIVE_IDLE)
+    return {
+        'socket': client_socket,
+        'address': client_address,
+        'session_id': session_id,
+        'hostname': hostname
+    }
+
+
+def finish_token_request(pending):
+    """
+    Push the operator's decision to a parked token request and close it
+
+    Args:
+        pending: Parked token request returned by handle_token_request
+
+    Returns:
+        bool: True if the request was finished, False if it is still pending
+    """
+    client_socket = pending['socket']
+    session_id = pending['session_id']
+    hostname = pending['hostname']
+
     try:
-        while True:
-            # Wait for next message from client (polling requests)
-            message = recv_message(client_socket)
+        token, status = token_manager.get_token_by_hostname(hostname)
 
-            if not message:
-                # Client disconnected
-                logger.info(f"[SESSION:{session_id}] Client {hostname} disconnected while waiting for approval")
-                break
+        if status == TOKEN_PENDING:
+            return False
 
-            if message.startswith(MSG_TOKEN_REQUEST):
-                # Handle polling request
-                parts = message.split(':', 2)
-                if len(parts) > 2 and parts[2] == 'status_check':
-                    # Check current status
-                    token, status = token_manager.get_token_by_hostname(hostname)
-
-                    if status == TOKEN_APPROVED:
-                        send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_APPROVED}:{token}")
-                        logger.info(f"[SESSION:{session_id}] Token approved sent to {hostname}")
-                        # Client will disconnect after receiving approval
-                        break
-                    elif status == TOKEN_DENIED:
-                        send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_DENIED}")
-                        logger.info(f"[SESSION:{session_id}] Token denied sent to {hostname}")
-                        break
-                    elif status == TOKEN_PENDING:
-                        # Still pending, send pending status
-                        send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_PENDING}")
-                    else:
-                        send_message(client_socket, f"{MSG_TOKEN_STATUS}:{TOKEN_INVALID}")
-                        break
-            else:
-                # Unexpected message type
-                logger.warning(f"[SESSION:{session_id}] Unexpected message from pending client {hostname}: {message[:50]}")
-                break
+        if status == TOKEN_APPROVED:
+            send_message_parts(client_socket, [_APPROVED_PREFIX, token.encode()])
+            logger.info(f"[SESSION:{session_id}] Token approved sent to {hostname}")
+        elif status == TOKEN_DENIED:
+            send_message(client_socket, _STATUS_MESSAGES[TOKEN_DENIED])
+            logger.info(f"[SESSION:{session_id}] Token denied sent to {hostname}")
+        else:
+            send_message(client_socket, _STATUS_MESSAGES[TOKEN_INVALID])
+
+    except Exception as e:
+        logger.error(f"[SESSION:{session_id}] Error sending token decision to {hostname}: {e}")
+
+    close_token_request(pending)
+    return True
+
+
+def drop_token_request(pending):
+    """
+    Handle traffic on a parked token request
+
+    Waiting clients never send anything, so readable means the client went
+    away (or misbehaved) and the request connection is closed either way.
+
+    Args:
+        pending: Parked token request returned by handle_token_request
+    """
+    client_socket = pending['socket']
+    session_id = pending['session_id']
+    hostname = pending['hostname']
+
+    try:
+        client_socket.settimeout(TOKEN_POLL_INTERVAL)
+        message = recv_message(client_socket)
+
+        if not message:
+            logger.info(f"[SESSION:{session_id}] Client {hostname} disconnected while waiting for approval")
+        else:
+            # Clients only wait for the pushed decision - anything else is unexpected
+            logger.warning(f"[SESSION:{session_id}] Unexpected message from pending client {hostname}: {message[:50]}")
 
     except Exception as e:
         logger.error(f"[SESSION:{session_id}] Error handling token polling for {hostname}: {e}")
-    finally:
-        # Clean up when done
-        logger.info(f"[SESSION:{session_id}] Closing token request connection for {hostname}")
+
+    close_token_request(pending)
+
+
+def close_token_request(pending):
+    """
+    Close a finished token request connection
+
+    Args:
+        pending: Parked token request returned by handle_token_request
+    """
+    logger.info(f"[SESSION:{pending['session_id']}] Closing token request connection for {pending['hostname']}")
+    try:
+        pending['socket'].close()
+    except:
+        pass
+
+
+def set_decision_wakeup(callback):
+    """
+    Register the callable that wakes the listener when a token decision is made
+
+    Args:
+        callback: Callable taking no arguments (None to unregister)
+    """
+    global _decision_wakeup
+    _decision_wakeup = callback
+
+
+def notify_token_decision(hostname):
+    """
+    Tell parked token requests for hostname that the operator has decided
+
+    Args:
+        hostname: Hostname whose token was approved, denied or otherwise changed
+    """
+    with pending_clients_lock:
+        decided_tokens.add(hostname)
+
+    wakeup = _decision_wakeup
+    if wakeup:
+        wakeup()
+
+
+def take_token_decisions():
+    """
+    Collect and clear the hostnames decided since the last call
+
+    Returns:
+        set: Hostnames with a new token decision
+    """
+    with pending_clients_lock:
+        decided = set(decided_tokens)
+        decided_tokens.clear()
+    return decided
 
 
 def disconnect_client(hostname, reason="Connection lost"):
@@ -343,29 +500,27 @@ def disconnect_client(hostname, reason="Connection lost"):
         reason: Reason for disconnection (for logging)
     """
     with clients_lock:
-        if hostname in clients:
-            client_info = clients[hostname]
-            session_id = client_info['session_id']
+        client_info = clients.get(hostname)
+        if not client_info:
+            return
 
-            # Close socket
-            try:
-                client_info['socket'].close()
-            except:
-                pass
+        # Remove from registry
+        remaining = dict(clients)
+        del remaining[hostname]
+        _swap_clients(remaining)
 
-            # Remove from registry
-            del clients[hostname]
+    session_id = client_info['session_id']
 
-            logger.warning(f"[SESSION:{session_id}] Client disconnected: {hostname} ({reason})")
+    # Close socket
+    try:
+        client_info['socket'].close()
+    except:
+        pass
 
-            # Notify operator
-            print(f"\n{Colors.RED}{Colors.BOLD}{'='*60}{Colors.RESET}")
-            print(f"{Colors.RED}{Colors.BOLD}  ⚠️  CLIENT DISCONNECTED{Colors.RESET}")
-            print(f"{Colors.RED}{Colors.BOLD}{'='*60}{Colors.RESET}")
-            print(f"{Colors.CYAN}   Hostname: {Colors.BOLD}{hostname}{Colors.RESET}")
-            print(f"{Colors.CYAN}   Reason: {Colors.BOLD}{reason}{Colors.RESET}")
-            print(f"{Colors.CYAN}   Session ID: {Colors.BOLD}{session_id}{Colors.RESET}")
-            print(f"{Colors.RED}{Colors.BOLD}{'='*60}{Colors.RESET}\n")
+    logger.warning(f"[SESSION:{session_id}] Client disconnected: {hostname} ({reason})")
+
+    # Notify operator
+    notify([_DISCONNECT_BANNER.format(hostname=hostname, reason=reason, session_id=session_id)])
 
 
 def send_command_to_client(hostname, command):
@@ -379,14 +534,13 @@ def send_command_to_client(hostname, command):
     Returns:
         tuple: (stdout, stderr) or (None, None) on error
     """
-    with clients_lock:
-        if hostname not in clients:
-            return None, "Client not found or not authenticated"
+    client_info = clients.get(hostname)
+    if not client_info:
+        return None, "Client not found or not authenticated"
 
-        client_info = clients[hostname]
-        client_socket = client_info['socket']
-        socket_lock = client_info['lock']
-        session_id = client_info['session_id']
+    client_socket = client_info['socket']
+    socket_lock = client_info['lock']
+    session_id = client_info['session_id']
 
     # Use per-client lock to prevent race conditions
     with socket_lock:
@@ -394,32 +548,72 @@ def send_command_to_client(hostname, command):
             logger.debug(f"[SESSION:{session_id}] Sending command to {hostname}: {command}")
 
             # Send command
-            if not send_message(client_socket, f"{MSG_CMD}:{command}"):
+            if not send_message_parts(client_socket, [_CMD_PREFIX, command.encode()]):
                 logger.warning(f"[SESSION:{session_id}] Failed to send command to {hostname}")
                 disconnect_client(hostname, "Failed to send command")
                 return None, "Client disconnected (failed to send command)"
 
             logger.info(f"[SESSION:{session_id}] Command sent to {hostname}: {command}")
 
-            # Wait for response with timeout
+            # Collect streamed RESULT_CHUNK messages until the closing RESULT
             client_socket.settimeout(SOCKET_TIMEOUT)
-            response = recv_message(client_socket)
+            stdout_parts = []
+            stderr_parts = []
 
-            if response is None:
-                logger.warning(f"[SESSION:{session_id}] No response from {hostname}")
-                disconnect_client(hostname, "No response received")
-                return None, "Client disconnected (no response)"
+            # Output kept so far - past MAX_MESSAGE_SIZE the rest is read but
+            # dropped, so a runaway command can't fill server memory
+            kept = 0
+            truncated = False
 
-            if not response.startswith(MSG_RESULT):
-                logger.warning(f"[SESSION:{session_id}] Invalid response format from {hostname}")
-                return None, "Invalid response format"
+            while True:
+                response = recv_message(client_socket, decode=False)
+
+                if response is None:
+                    logger.warning(f"[SESSION:{session_id}] No response from {hostname}")
+                    disconnect_client(hostname, "No response received")
+                    return None, "Client disconnected (no response)"
+
+                # Locate fields by index and keep zero-copy views of the
+                # payload - partition() would copy every (up to 64K) chunk twice
+                type_end = response.find(b':')
+                msg_type = response[:type_end] if type_end >= 0 else response
+                view = memoryview(response)
+
+                if msg_type == MSG_RESULT_CHUNK_B:
+                    # RESULT_CHUNK:stream:data
+                    stream_end = response.find(b':', type_end + 1)
+                    if stream_end >= 0 and not truncated:
+                        stream = response[type_end + 1:stream_end]
+                        data = view[stream_end + 1:]
+                        if kept + len(data) > MAX_MESSAGE_SIZE:
+                            data = data[:MAX_MESSAGE_SIZE - kept]
+                            truncated = True
+                            logger.warning(f"[SESSION:{session_id}] Output from {hostname} exceeds "
+                                           f"{MAX_MESSAGE_SIZE} bytes - truncating")
+                        kept += len(data)
+                        (stderr_parts if stream == b'stderr' else stdout_parts).append(data)
+                    continue
+
+                if msg_type != MSG_RESULT_B:
+                    logger.warning(f"[SESSION:{session_id}] Invalid response format from {hostname}")
+                    return None, "Invalid response format"
+
+                # Parse result: RESULT:stdout|||stderr (empty after streamed chunks;
+                # a single RESULT is already bounded by recv_message's size limit)
+                split = response.find(b'|||', type_end + 1)
+                if split >= 0:
+                    stdout_parts.append(view[type_end + 1:split])
+                    stderr_parts.append(view[split + 3:])
+                else:
+                    stdout_parts.append(view[type_end + 1:])
+                break
 
-            # Parse result: RESULT:stdout|||stderr
-            result_data = response.split(':', 1)[1]
-            parts = result_data.split('|||')
+            if truncated:
+                stderr_parts.append(b"\n[output truncated]")
 
-            stdout = parts[0] if len(parts) > 0 else ''
-            stderr = parts[1] if len(parts) > 1 else ''
+            # Decode once at the end so multi-byte characters split across chunks survive
+            stdout = b''.join(stdout_parts).decode('utf-8', errors='replace')
+            stderr = b''.join(stderr_parts).decode('utf-8', errors='replace')
 
             logger.info(f"[SESSION:{session_id}] Response received from {hostname}: {len(stdout)} bytes stdout, {len(stderr)} bytes stderr")
 
@@ -435,6 +629,16 @@ def send_command_to_client(hostname, command):
             return None, f"Client disconnected ({str(e)})"
 
 
+def get_clients():
+    """
+    Get the current client registry without locking
+
+    Returns:
+        dict: {hostname: info_dict} snapshot - never modified in place, don't modify it
+    """
+    return clients
+
+
 def get_clients_list():
     """
     Get list of connected and authenticated clients
@@ -442,9 +646,8 @@ def get_clients_list():
     Returns:
         list: List of tuples (index, hostname, info_dict)
     """
-    with clients_lock:
-        return [(idx, hostname, info)
-                for idx, (hostname, info) in enumerate(clients.items(), 1)]
+    return [(idx, hostname, info)
+            for idx, (hostname, info) in enumerate(clients.items(), 1)]
 
 
 def get_hostname_by_number(number):
@@ -458,12 +661,6 @@ def get_hostname_by_number(number):
         str: Hostname or None if not found
     """
     try:
-        num = int(number)
-        client_list = get_clients_list()
-
-        for idx, hostname, info in client_list:
-            if idx == num:
-                return hostname
-        return None
-    except (ValueError, IndexError):
+        return client_index.get(int(number))
+    except ValueError:
         return None
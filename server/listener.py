@@ -3,65 +3,249 @@ Network Listener Module
 Handles TCP socket binding and accepting client connections
 """
 
+import functools
+import queue
+import selectors
 import socket
 import ssl
-import threading
-from common.config import HOST, PORT, TLS_ENABLED, SERVER_CERT, SERVER_KEY
-from server.client_handler import handle_client
+import time
+from concurrent.futures import ThreadPoolExecutor
+from common.config import (
+    HOST, PORT, TLS_ENABLED, SERVER_CERT, SERVER_KEY, TLS_CIPHERS,
+    LISTENER_WORKERS, HANDSHAKE_TIMEOUT, TOKEN_POLL_INTERVAL,
+    LISTEN_BACKLOG, LISTEN_REUSEPORT, TOKEN_PENDING
+)
+from common.protocol import enable_nodelay, enable_keepalive
+from server.client_handler import (
+    handle_client, finish_token_request, drop_token_request,
+    set_decision_wakeup, take_token_decisions
+)
 from server.logger_config import logger
+from server import token_manager
 
 
-def start_listener():
+@functools.lru_cache(maxsize=1)
+def get_local_ip():
+    """
+    Get this machine's LAN address (resolved once, then cached)
+
+    Returns:
+        str: IP address, or None if it can't be resolved
+    """
+    try:
+        return socket.gethostbyname(socket.gethostname())
+    except OSError:
+        return None
+
+
+@functools.lru_cache(maxsize=1)
+def get_ssl_context():
+    """
+    Get the server TLS context (built and certificate loaded once per process)
+
+    Returns:
+        ssl.SSLContext: Server-side context shared by every connection
+    """
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.load_cert_chain(SERVER_CERT, SERVER_KEY)
+    # Don't require client certificates (we use token auth instead)
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+
+    # TLS 1.2+ with AEAD suites only; TLS 1.3 suites are AEAD already
+    ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
+    ssl_context.set_ciphers(TLS_CIPHERS)
+    ssl_context.options |= ssl.OP_NO_COMPRESSION
+    return ssl_context
+
+
+def start_listener(ready=None):
     """
     Start TCP listener on configured HOST:PORT
-    Accepts incoming client connections and spawns handler threads
+
+    One selector loop accepts connections and parks token requests that are
+    waiting for the operator. TLS handshakes, registration and token decisions
+    run on a fixed-size worker pool, so idle connections never hold a thread.
+    The CLI wakes the loop when it approves or denies a request, so decisions
+    are pushed immediately; a slow periodic check catches any other changes.
+
+    Args:
+        ready: Optional threading.Event set once connections are being accepted
+            (also set if the listener fails, so waiters are never stuck)
     """
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if LISTEN_REUSEPORT and hasattr(socket, 'SO_REUSEPORT'):
+        # Kernel load-balances accepts across every process bound to PORT
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+    selector = selectors.DefaultSelector()
+    pool = ThreadPoolExecutor(max_workers=LISTENER_WORKERS, thread_name_prefix='c2-worker')
+
+    # Workers hand parked token requests back to the selector thread through
+    # this queue, and write a byte to the wakeup pair to interrupt select()
+    parked = queue.SimpleQueue()
+    wakeup_recv, wakeup_send = socket.socketpair()
+    wakeup_recv.setblocking(False)
+    wakeup_send.setblocking(False)
+
+    def wakeup():
+        try:
+            wakeup_send.send(b'\0')
+        except BlockingIOError:
+            pass  # A wakeup is already queued
+
+    def park(pending):
+        parked.put(pending)
+        wakeup()
+
+    def serve(client_socket, client_address, ssl_context):
+        # TLS handshake runs here on the worker, never on the accept loop
+        if ssl_context:
+            client_socket = ssl_context.wrap_socket(client_socket, server_side=True,
+                                                    do_handshake_on_connect=False)
+            try:
+                client_socket.do_handshake()
+                logger.debug(f"TLS handshake completed with {client_address[0]}")
+            except socket.timeout:
+                logger.warning(f"TLS handshake timed out with {client_address[0]}")
+                client_socket.close()
+                return
+            except (ssl.SSLError, OSError) as e:
+                logger.warning(f"TLS handshake failed with {client_address[0]}: {e}")
+                client_socket.close()
+                return
+
+        pending = handle_client(client_socket, client_address)
+        if pending:
+            park(pending)
+
+    def finish(pending):
+        if not finish_token_request(pending):
+            park(pending)
 
     try:
         server_socket.bind((HOST, PORT))
-        server_socket.listen(5)
+        server_socket.listen(LISTEN_BACKLOG)
+        server_socket.setblocking(False)
 
         # Wrap socket with TLS if enabled
+        ssl_context = None
         if TLS_ENABLED:
-            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-            ssl_context.load_cert_chain(SERVER_CERT, SERVER_KEY)
-            # Don't require client certificates (we use token auth instead)
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
+            ssl_context = get_ssl_context()
             logger.info("TLS/SSL encryption enabled")
 
         # Get and display server IP
-        local_ip = socket.gethostbyname(socket.gethostname())
+        local_ip = get_local_ip() or HOST
         logger.info(f"Server started on {local_ip}:{PORT}")
         logger.info(f"Listening on all interfaces ({HOST}:{PORT})")
         logger.info("Waiting for client connections...")
 
+        selector.register(server_socket, selectors.EVENT_READ)
+        selector.register(wakeup_recv, selectors.EVENT_READ)
+        set_decision_wakeup(wakeup)
+        if ready:
+            ready.set()
+
+        next_decision_check = time.monotonic() + TOKEN_POLL_INTERVAL
+
         while True:
-            client_socket, client_address = server_socket.accept()
+            events = selector.select(timeout=max(0, next_decision_check - time.monotonic()))
+
+            for key, _ in events:
+                if key.fileobj is server_socket:
+                    accept_connections(server_socket, pool, serve, ssl_context)
+                elif key.fileobj is wakeup_recv:
+                    drain_wakeups(wakeup_recv)
+                else:
+                    # Waiting clients never send - readable means gone or misbehaving
+                    selector.unregister(key.fileobj)
+                    pool.submit(drop_token_request, key.data)
+
+            # Park token requests handed back by workers. A decision made before
+            # a request got here had no selector key to match, so check first.
+            while not parked.empty():
+                pending = parked.get()
+                _, status = token_manager.get_token_by_hostname(pending['hostname'])
+                if status == TOKEN_PENDING:
+                    selector.register(pending['socket'], selectors.EVENT_READ, pending)
+                else:
+                    pool.submit(finish, pending)
+
+            # Push decisions the operator just made
+            decided = take_token_decisions()
+            if decided:
+                for key in list(selector.get_map().values()):
+                    if key.data and key.data['hostname'] in decided:
+                        selector.unregister(key.fileobj)
+                        pool.submit(finish, key.data)
 
-            # Wrap with TLS if enabled
-            if TLS_ENABLED:
-                try:
-                    client_socket = ssl_context.wrap_socket(client_socket, server_side=True)
-                    logger.debug(f"TLS handshake completed with {client_address[0]}")
-                except ssl.SSLError as e:
-                    logger.warning(f"TLS handshake failed with {client_address[0]}: {e}")
-                    client_socket.close()
-                    continue
-
-            # Spawn new thread for each client
-            client_thread = threading.Thread(
-                target=handle_client,
-                args=(client_socket, client_address),
-                daemon=True
-            )
-            client_thread.start()
+            # Periodically catch token changes made without a notification
+            if time.monotonic() < next_decision_check:
+                continue
+            next_decision_check = time.monotonic() + TOKEN_POLL_INTERVAL
+
+            waiting = [key for key in selector.get_map().values() if key.data]
+            if waiting:
+                still_pending = {hostname for _, hostname, _, _ in token_manager.get_pending_requests()}
+                for key in waiting:
+                    if key.data['hostname'] not in still_pending:
+                        selector.unregister(key.fileobj)
+                        pool.submit(finish, key.data)
 
     except KeyboardInterrupt:
         logger.info("Listener shutting down...")
     except Exception as e:
         logger.error(f"Listener error: {e}")
     finally:
+        if ready:
+            ready.set()
+        set_decision_wakeup(None)
+        selector.close()
+        pool.shutdown(wait=False)
+        wakeup_recv.close()
+        wakeup_send.close()
         server_socket.close()
+
+
+def accept_connections(server_socket, pool, serve, ssl_context):
+    """
+    Accept every queued connection and hand each one to the worker pool
+
+    Args:
+        server_socket: Non-blocking listening socket
+        pool: Worker pool running the per-connection setup
+        serve: Callable(client_socket, client_address, ssl_context) run on a worker
+        ssl_context: Server TLS context, or None when TLS is disabled
+    """
+    while True:
+        try:
+            client_socket, client_address = server_socket.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            # e.g. out of file descriptors - leave the rest queued for the next round
+            logger.warning(f"Failed to accept connection: {e}")
+            return
+
+        # Blocking I/O on workers, bounded so a silent peer can't pin one forever
+        client_socket.settimeout(HANDSHAKE_TIMEOUT)
+        enable_nodelay(client_socket)
+
+        # Registered clients sit idle between commands - let the kernel spot dead peers
+        enable_keepalive(client_socket)
+        pool.submit(serve, client_socket, client_address, ssl_context)
+
+
+def drain_wakeups(wakeup_recv):
+    """
+    Discard pending wakeup bytes
+
+    Args:
+        wakeup_recv: Non-blocking read end of the wakeup socket pair
+    """
+    try:
+        while wakeup_recv.recv(4096):
+            pass
+    except BlockingIOError:
+        pass
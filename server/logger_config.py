@@ -3,15 +3,79 @@ Server Logging Configuration
 Sets up dual logging (console + file) with timestamps
 """
 
+import atexit
 import logging
+import queue
 import sys
-from common.config import LOG_FILE, LOG_LEVEL_CONSOLE, LOG_LEVEL_FILE
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from common.config import (
+    LOG_FILE, LOG_LEVEL_CONSOLE, LOG_LEVEL_FILE, LOG_FILE_BUFFER, LOG_FLUSH_INTERVAL
+)
+
+
+class BufferedFileHandler(logging.FileHandler):
+    """
+    File handler that batches writes in a large buffer
+
+    logging.FileHandler flushes after every record; this one only flushes
+    when flush_now() is called (periodically), when the buffer fills, for
+    ERROR and above, and on close.
+    """
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=LOG_FILE_BUFFER, encoding=self.encoding)
+
+    def flush(self):
+        pass  # Called after every record by StreamHandler.emit - see flush_now
+
+    def flush_now(self):
+        """Write buffered records to disk"""
+        with self.lock:
+            if self.stream:
+                self.stream.flush()
+
+    def emit(self, record):
+        super().emit(record)
+        if record.levelno >= logging.ERROR:
+            self.flush_now()
+
+
+class SecondCachedFormatter(logging.Formatter):
+    """
+    Formatter that renders each second's timestamp only once
+
+    The file format has one-second resolution, so every record logged in the
+    same second shares the string; formatTime otherwise does a localtime()
+    and strftime() per record. Only used on the QueueListener thread.
+    """
+
+    _cached_second = None
+    _cached_time = None
+
+    def formatTime(self, record, datefmt=None):
+        second = int(record.created)
+        if second != self._cached_second:
+            self._cached_time = super().formatTime(record, datefmt)
+            self._cached_second = second
+        return self._cached_time
+
+
+def _flush_periodically(handler):
+    """Flush thread: push buffered log records to disk every LOG_FLUSH_INTERVAL"""
+    while True:
+        time.sleep(LOG_FLUSH_INTERVAL)
+        handler.flush_now()
 
 
 def setup_logging():
     """
     Configure logging to both console and file with timestamps
 
+    Log calls only enqueue the record; a background QueueListener formats it
+    and does the console/file I/O, so callers never wait on the disk.
+
     Returns:
         logging.Logger: Configured logger instance
     """
@@ -27,18 +91,28 @@ def setup_logging():
     console_format = logging.Formatter('[%(levelname)s] %(message)s')
     console_handler.setFormatter(console_format)
 
-    # File handler - DEBUG level with timestamps
-    file_handler = logging.FileHandler(LOG_FILE, mode='a', encoding='utf-8')
+    # File handler - DEBUG level with timestamps, flushed in batches
+    file_handler = BufferedFileHandler(LOG_FILE, mode='a', encoding='utf-8')
     file_handler.setLevel(getattr(logging, LOG_LEVEL_FILE))
-    file_format = logging.Formatter(
+    file_format = SecondCachedFormatter(
         '[%(asctime)s] [%(levelname)s] %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     file_handler.setFormatter(file_format)
 
-    # Add both handlers (Level 2: log to console AND file)
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    # Both handlers (Level 2: log to console AND file) run on the listener thread
+    # SimpleQueue: put/get are atomic in C - no Lock + Condition per log record
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    listener.start()
+
+    threading.Thread(target=_flush_periodically, args=(file_handler,),
+                     name='c2-log-flush', daemon=True).start()
+
+    # Flush whatever is still queued when the process exits
+    atexit.register(file_handler.flush_now)
+    atexit.register(listener.stop)
 
     return logger
 
@@ -6,14 +6,21 @@ Starts listener and operator CLI
 
 import threading
 import time
-import socket
+import queue
 import os
-from server.listener import start_listener
-from server.cli import operator_cli, Colors
+from server.listener import start_listener, get_local_ip
+from server.cli import operator_cli, RESET, RED, GREEN, YELLOW, MAGENTA, CYAN, BOLD
 from server.logger_config import logger
-from server import token_manager
+from server.notifications import notify, emit
+from server import token_manager, setup_security
 from common.config import HOST, PORT, TLS_ENABLED, SERVER_CERT, SERVER_KEY
 
+# How long the startup banner waits for the public IP lookup before moving on
+PUBLIC_IP_WAIT = 0.5
+
+# Upper bound on waiting for the listener to come up before starting the CLI
+LISTENER_START_TIMEOUT = 5
+
 
 def get_public_ip():
     """Get public IP address for remote connections"""
@@ -39,75 +46,120 @@ def get_public_ip():
         return None
 
 
-def show_startup_banner():
-    """Display server startup banner with connection instructions"""
+def start_public_ip_lookup():
+    """
+    Look up the public IP on a background thread so startup isn't held up
+
+    Returns:
+        queue.Queue: Receives the public IP (or None) once the lookup finishes
+    """
+    result = queue.Queue(maxsize=1)
+    threading.Thread(target=lambda: result.put(get_public_ip()), daemon=True).start()
+    return result
+
+
+def report_late_public_ip(public_ip_result):
+    """
+    Wait for a public IP lookup that missed the banner and alert the operator
+
+    Args:
+        public_ip_result: Queue returned by start_public_ip_lookup
+    """
+    public_ip = public_ip_result.get()
+    if public_ip:
+        notify([
+            f"{CYAN}📡 Public Address: {BOLD}{YELLOW}{public_ip}:{PORT}{RESET} {CYAN}(remote access){RESET}",
+            f"   • Different network clients connect to: {YELLOW}{BOLD}{public_ip}:{PORT}{RESET}",
+        ])
+
+
+def show_startup_banner(public_ip_result):
+    """
+    Display server startup banner with connection instructions
+
+    Args:
+        public_ip_result: Queue returned by start_public_ip_lookup
+    """
     # Get local IP (for same network)
-    try:
-        local_ip = socket.gethostbyname(socket.gethostname())
-    except:
-        local_ip = "Unable to detect"
+    local_ip = get_local_ip() or "Unable to detect"
 
-    # Get public IP (for remote connections)
-    public_ip = get_public_ip()
+    # Get public IP (for remote connections) - don't wait long for a slow lookup
+    public_ip_pending = False
+    try:
+        public_ip = public_ip_result.get(timeout=PUBLIC_IP_WAIT)
+    except queue.Empty:
+        public_ip = None
+        public_ip_pending = True
+        threading.Thread(target=report_late_public_ip, args=(public_ip_result,), daemon=True).start()
 
-    print(f"\n{Colors.GREEN}{Colors.BOLD}{'='*70}{Colors.RESET}")
-    print(f"{Colors.GREEN}{Colors.BOLD}  C2 SERVER - READY FOR CONNECTIONS{Colors.RESET}")
-    print(f"{Colors.GREEN}{Colors.BOLD}{'='*70}{Colors.RESET}\n")
+    # Whole banner goes out in one write
+    lines = []
+    lines.append(f"\n{GREEN}{BOLD}{'='*70}{RESET}")
+    lines.append(f"{GREEN}{BOLD}  C2 SERVER - READY FOR CONNECTIONS{RESET}")
+    lines.append(f"{GREEN}{BOLD}{'='*70}{RESET}\n")
 
-    print(f"{Colors.CYAN}{Colors.BOLD}📡 Server Information:{Colors.RESET}")
-    print(f"   • Listening on: {Colors.BOLD}{HOST}:{PORT}{Colors.RESET} (all interfaces)")
+    lines.append(f"{CYAN}{BOLD}📡 Server Information:{RESET}")
+    lines.append(f"   • Listening on: {BOLD}{HOST}:{PORT}{RESET} (all interfaces)")
 
     # Display both IPs with port
-    print(f"   • Local Address: {Colors.BOLD}{Colors.GREEN}{local_ip}:{PORT}{Colors.RESET} {Colors.CYAN}(same network){Colors.RESET}")
+    lines.append(f"   • Local Address: {BOLD}{GREEN}{local_ip}:{PORT}{RESET} {CYAN}(same network){RESET}")
     if public_ip:
-        print(f"   • Public Address: {Colors.BOLD}{Colors.YELLOW}{public_ip}:{PORT}{Colors.RESET} {Colors.CYAN}(remote access){Colors.RESET}")
+        lines.append(f"   • Public Address: {BOLD}{YELLOW}{public_ip}:{PORT}{RESET} {CYAN}(remote access){RESET}")
+    elif public_ip_pending:
+        lines.append(f"   • Public Address: {YELLOW}Detecting...{RESET} {CYAN}(will be shown once known){RESET}")
     else:
-        print(f"   • Public Address: {Colors.YELLOW}Unable to detect{Colors.RESET} {Colors.CYAN}(check manually if needed){Colors.RESET}")
+        lines.append(f"   • Public Address: {YELLOW}Unable to detect{RESET} {CYAN}(check manually if needed){RESET}")
 
-    print(f"   • Security: {Colors.GREEN}TLS Encryption + Per-Client Tokens{Colors.RESET}")
+    lines.append(f"   • Security: {GREEN}TLS Encryption + Per-Client Tokens{RESET}")
 
-    print(f"\n{Colors.YELLOW}{Colors.BOLD}📱 HOW TO CONNECT A CLIENT:{Colors.RESET}")
-    print(f"{Colors.BOLD}   Step 1:{Colors.RESET} On the client machine, run:")
-    print(f"           {Colors.CYAN}python c2_client.py{Colors.RESET}")
-    print(f"{Colors.BOLD}   Step 2:{Colors.RESET} Enter server address:")
-    print(f"           • Same WiFi/network: {Colors.GREEN}{Colors.BOLD}{local_ip}:{PORT}{Colors.RESET}")
+    lines.append(f"\n{YELLOW}{BOLD}📱 HOW TO CONNECT A CLIENT:{RESET}")
+    lines.append(f"{BOLD}   Step 1:{RESET} On the client machine, run:")
+    lines.append(f"           {CYAN}python c2_client.py{RESET}")
+    lines.append(f"{BOLD}   Step 2:{RESET} Enter server address:")
+    lines.append(f"           • Same WiFi/network: {GREEN}{BOLD}{local_ip}:{PORT}{RESET}")
     if public_ip:
-        print(f"           • Different network: {Colors.YELLOW}{Colors.BOLD}{public_ip}:{PORT}{Colors.RESET}")
-    print(f"{Colors.BOLD}   Step 3:{Colors.RESET} Client will request a token automatically")
-    print(f"{Colors.BOLD}   Step 4:{Colors.RESET} You'll see a notification here - approve it!")
+        lines.append(f"           • Different network: {YELLOW}{BOLD}{public_ip}:{PORT}{RESET}")
+    lines.append(f"{BOLD}   Step 3:{RESET} Client will request a token automatically")
+    lines.append(f"{BOLD}   Step 4:{RESET} You'll see a notification here - approve it!")
+
+    lines.append(f"\n{MAGENTA}{BOLD}💡 HELPFUL TIPS:{RESET}")
+    lines.append(f"   • Type {BOLD}help{RESET} to see all available commands")
+    lines.append(f"   • Type {BOLD}list{RESET} to see connected clients and pending requests")
+    lines.append(f"   • Approve token requests with: {BOLD}approve <hostname>{RESET}")
+    lines.append(f"   • Use {BOLD}use <#>{RESET} to interact with a client (e.g., {BOLD}use 1{RESET})")
 
-    print(f"\n{Colors.MAGENTA}{Colors.BOLD}💡 HELPFUL TIPS:{Colors.RESET}")
-    print(f"   • Type {Colors.BOLD}help{Colors.RESET} to see all available commands")
-    print(f"   • Type {Colors.BOLD}list{Colors.RESET} to see connected clients and pending requests")
-    print(f"   • Approve token requests with: {Colors.BOLD}approve <hostname>{Colors.RESET}")
-    print(f"   • Use {Colors.BOLD}use <#>{Colors.RESET} to interact with a client (e.g., {Colors.BOLD}use 1{Colors.RESET})")
+    lines.append(f"\n{CYAN}📝 Logs: {BOLD}c2_server.log{RESET}")
+    lines.append(f"{GREEN}{BOLD}{'='*70}{RESET}\n")
 
-    print(f"\n{Colors.CYAN}📝 Logs: {Colors.BOLD}c2_server.log{Colors.RESET}")
-    print(f"{Colors.GREEN}{Colors.BOLD}{'='*70}{Colors.RESET}\n")
+    emit(lines)
 
 
 def run_auto_setup():
-    """Run automatic security setup if certificates are missing"""
-    print(f"\n{Colors.YELLOW}{'='*70}{Colors.RESET}")
-    print(f"{Colors.YELLOW}  🔧 AUTOMATIC SECURITY SETUP{Colors.RESET}")
-    print(f"{Colors.YELLOW}{'='*70}{Colors.RESET}\n")
-    print(f"{Colors.CYAN}TLS certificates not found.{Colors.RESET}")
-    print(f"{Colors.CYAN}Generating certificates automatically...{Colors.RESET}\n")
+    """Run automatic security setup if certificates are missing or about to expire"""
+    print(f"\n{YELLOW}{'='*70}{RESET}")
+    print(f"{YELLOW}  🔧 AUTOMATIC SECURITY SETUP{RESET}")
+    print(f"{YELLOW}{'='*70}{RESET}\n")
+    print(f"{CYAN}TLS certificates not found or about to expire.{RESET}")
+    print(f"{CYAN}Generating certificates automatically...{RESET}\n")
 
     # Automatically run setup without prompting
-    print(f"{Colors.GREEN}[*] Running automatic setup...{Colors.RESET}\n")
+    print(f"{GREEN}[*] Running automatic setup...{RESET}\n")
 
-    # Import and run setup
+    # Run setup
     try:
-        from server import setup_security
-        print(f"\n{Colors.GREEN}[+] Certificates generated successfully!{Colors.RESET}")
-        print(f"{Colors.GREEN}[+] Security configured!{Colors.RESET}")
-        print(f"{Colors.GREEN}[*] Starting server...{Colors.RESET}\n")
+        setup_security.generate_certificates(SERVER_CERT, SERVER_KEY)
+        print(f"\n{GREEN}[+] Certificates generated successfully!{RESET}")
+        print(f"{GREEN}[+] Security configured!{RESET}")
+        print(f"{GREEN}[*] Starting server...{RESET}\n")
         time.sleep(1)
         return True
+    except ImportError:
+        print(f"{RED}[!] Setup failed: cryptography package not found{RESET}")
+        print(f"{YELLOW}[*] Install with: pip install cryptography{RESET}")
+        return False
     except Exception as e:
-        print(f"{Colors.RED}[!] Setup failed: {e}{Colors.RESET}")
-        print(f"{Colors.YELLOW}[*] Please run manually: python server/setup_security.py{Colors.RESET}")
+        print(f"{RED}[!] Setup failed: {e}{RESET}")
+        print(f"{YELLOW}[*] Please run manually: python server/setup_security.py{RESET}")
         return False
 
 
@@ -117,14 +169,17 @@ def main():
     logger.info("C2 Server starting...")
     logger.info("="*60)
 
+    # Public IP discovery is slow network I/O - start it before anything else
+    public_ip_result = start_public_ip_lookup()
+
     # Check security setup with auto-setup option
     if TLS_ENABLED:
-        if not os.path.exists(SERVER_CERT) or not os.path.exists(SERVER_KEY):
+        if not setup_security.certificates_valid(SERVER_CERT, SERVER_KEY):
             if not run_auto_setup():
                 return
             # Verify setup worked
             if not os.path.exists(SERVER_CERT) or not os.path.exists(SERVER_KEY):
-                print(f"{Colors.RED}[!] Setup verification failed{Colors.RESET}")
+                print(f"{RED}[!] Setup verification failed{RESET}")
                 return
 
     # Initialize token database
@@ -138,25 +193,26 @@ def main():
 
     except Exception as e:
         logger.error(f"Failed to initialize token database: {e}")
-        print(f"{Colors.RED}[!] Error initializing token database: {e}{Colors.RESET}")
+        print(f"{RED}[!] Error initializing token database: {e}{RESET}")
         return
 
     # Show startup banner
-    show_startup_banner()
+    show_startup_banner(public_ip_result)
 
     # Display security status
     if TLS_ENABLED:
-        print(f"{Colors.GREEN}Security: TLS encryption + per-client token authentication{Colors.RESET}")
-        print(f"{Colors.GREEN}Token System: Per-client approval workflow enabled{Colors.RESET}\n")
+        print(f"{GREEN}Security: TLS encryption + per-client token authentication{RESET}")
+        print(f"{GREEN}Token System: Per-client approval workflow enabled{RESET}\n")
     else:
-        print(f"{Colors.RED}Warning: Running without encryption{Colors.RESET}\n")
+        print(f"{RED}Warning: Running without encryption{RESET}\n")
 
     # Start listener in background thread
-    listener_thread = threading.Thread(target=start_listener, daemon=True)
+    listener_ready = threading.Event()
+    listener_thread = threading.Thread(target=start_listener, args=(listener_ready,), daemon=True)
     listener_thread.start()
 
-    # Give listener time to start
-    time.sleep(0.5)
+    # Wait until the listener is accepting (or has given up) instead of a fixed sleep
+    listener_ready.wait(timeout=LISTENER_START_TIMEOUT)
 
     # Run operator CLI in main thread
     try:
@@ -0,0 +1,92 @@
+"""
+Operator Notifications Module
+Queues alerts raised on worker threads and prints them to the operator in batches
+"""
+
+import os
+import queue
+import sys
+import threading
+
+
+# Alerts waiting to be printed, oldest first (each one a list of lines).
+# SimpleQueue's put/get are atomic in C, so posting an alert takes no Python-level lock.
+# Deliberately a single queue: alerts must print in the order they happened
+# (a connect before its disconnect), and one printer thread drains it anyway.
+_alerts = queue.SimpleQueue()
+
+# Printer thread, started on first use (the lock only guards that start)
+_printer = None
+_printer_lock = threading.Lock()
+
+
+def emit(lines):
+    """
+    Write a block of output lines with a single write
+
+    Goes straight to the stdout file descriptor when there is one, skipping
+    the TextIOWrapper; falls back to sys.stdout.write otherwise (e.g. tests).
+
+    Args:
+        lines: List of strings, one per output line
+    """
+    text = "\n".join(lines) + "\n"
+    try:
+        fd = sys.stdout.fileno()
+    except (AttributeError, OSError, ValueError):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        return
+
+    # Anything print() left in the text buffer must go out first
+    sys.stdout.flush()
+    payload = memoryview(text.encode(sys.stdout.encoding or 'utf-8', errors='replace'))
+    while payload:
+        payload = payload[os.write(fd, payload):]
+
+
+def notify(lines):
+    """
+    Queue an operator alert without blocking the caller on terminal output
+
+    Args:
+        lines: List of strings making up one alert
+    """
+    _alerts.put(lines)
+    if _printer is None:
+        _start_printer()
+
+
+def _start_printer():
+    """Start the printer thread once"""
+    global _printer
+    with _printer_lock:
+        if _printer is None:
+            _printer = threading.Thread(target=_print_alerts, name='c2-notify', daemon=True)
+            _printer.start()
+
+
+def drain_all():
+    """
+    Take every queued alert at once
+
+    Returns:
+        list: Queued alerts (each a list of lines), oldest first - empty if none
+    """
+    drained = []
+    try:
+        while True:
+            drained.append(_alerts.get_nowait())
+    except queue.Empty:
+        return drained
+
+
+def _print_alerts():
+    """Printer thread: wait for alerts and write everything queued in one go"""
+    while True:
+        # Block for the first alert, then take whatever else piled up behind it
+        alerts = [_alerts.get()]
+        alerts += drain_all()
+
+        # A burst of connections becomes one write instead of one per print
+        emit([line for alert in alerts for line in alert])
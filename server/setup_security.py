@@ -6,103 +6,166 @@ NOTE: This script runs AUTOMATICALLY when you start the server!
 You only need to run this manually if you want to regenerate certificates.
 """
 
+import datetime
 import os
 import sys
+from pathlib import Path
 
-print("=" * 60)
-print("  C2 Security Setup")
-print("=" * 60)
-print()
-print("NOTE: This runs automatically when you start the server!")
-print("You only need to run this manually to regenerate certificates.")
-print()
+# Certificate locations and lifetime
+CERT_FILE = "certs/server.crt"
+KEY_FILE = "certs/server.key"
+VALID_DAYS = 365
+RENEW_DAYS = 7  # Regenerate at startup once the certificate is this close to expiry
 
-# Check for cryptography package
-try:
+# EC P-256 keys generate in a fraction of the time of RSA and handshake just as fast.
+# Set to True for an RSA-3072 key instead (for clients without ECDSA support).
+USE_RSA = False
+
+
+def certificates_valid(cert_file=CERT_FILE, key_file=KEY_FILE):
+    """
+    Check that the certificate and key exist and the certificate isn't about to expire
+
+    Args:
+        cert_file: Certificate path
+        key_file: Private key path
+
+    Returns:
+        bool: True if the existing files can be used as they are
+    """
+    if not (os.path.exists(cert_file) and os.path.exists(key_file)):
+        return False
+
+    # Only the certificate parser is needed here - key generation stays unimported
+    try:
+        from cryptography import x509
+    except ImportError:
+        return True  # Can't check the expiry date - trust the existing files
+
+    try:
+        with open(cert_file, "rb") as f:
+            cert = x509.load_pem_x509_certificate(f.read())
+    except (OSError, ValueError):
+        return False
+
+    # not_valid_after_utc is timezone-aware (cryptography 42+); older versions return naive UTC
+    expires = getattr(cert, "not_valid_after_utc", None) or \
+        cert.not_valid_after.replace(tzinfo=datetime.timezone.utc)
+    renew_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=RENEW_DAYS)
+    return expires > renew_at
+
+
+def generate_certificates(cert_file=CERT_FILE, key_file=KEY_FILE):
+    """
+    Generate a self-signed certificate and private key
+
+    Args:
+        cert_file: Certificate path to write
+        key_file: Private key path to write
+
+    Raises:
+        ImportError: If the cryptography package is not installed
+    """
     from cryptography import x509
     from cryptography.x509.oid import NameOID
     from cryptography.hazmat.primitives import hashes
-    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
     from cryptography.hazmat.primitives import serialization
     from ipaddress import IPv4Address
-    import datetime
-except ImportError:
-    print("[!] Error: cryptography package not found")
-    print("[!] Install with: pip install cryptography")
-    sys.exit(1)
-
-print("[*] Generating TLS/SSL certificates...")
-
-# Create certs directory
-os.makedirs("certs", exist_ok=True)
-
-# Generate private key
-private_key = rsa.generate_private_key(
-    public_exponent=65537,
-    key_size=2048,
-)
-
-# Certificate subject and issuer (self-signed)
-subject = issuer = x509.Name([
-    x509.NameAttribute(NameOID.COUNTRY_NAME, "US"),
-    x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "State"),
-    x509.NameAttribute(NameOID.LOCALITY_NAME, "City"),
-    x509.NameAttribute(NameOID.ORGANIZATION_NAME, "C2Server"),
-    x509.NameAttribute(NameOID.COMMON_NAME, "localhost"),
-])
-
-# Build certificate
-cert = x509.CertificateBuilder().subject_name(
-    subject
-).issuer_name(
-    issuer
-).public_key(
-    private_key.public_key()
-).serial_number(
-    x509.random_serial_number()
-).not_valid_before(
-    datetime.datetime.utcnow()
-).not_valid_after(
-    datetime.datetime.utcnow() + datetime.timedelta(days=365)
-).add_extension(
-    x509.SubjectAlternativeName([
-        x509.DNSName("localhost"),
-        x509.IPAddress(IPv4Address("127.0.0.1")),
-    ]),
-    critical=False,
-).sign(private_key, hashes.SHA256())
-
-# Write private key
-with open("certs/server.key", "wb") as f:
-    f.write(private_key.private_bytes(
+
+    # Create certs directory
+    os.makedirs(os.path.dirname(cert_file) or ".", exist_ok=True)
+    os.makedirs(os.path.dirname(key_file) or ".", exist_ok=True)
+
+    # Generate private key
+    if USE_RSA:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=3072)
+    else:
+        private_key = ec.generate_private_key(ec.SECP256R1())
+
+    # Certificate subject and issuer (self-signed)
+    subject = issuer = x509.Name([
+        x509.NameAttribute(NameOID.COUNTRY_NAME, "US"),
+        x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "State"),
+        x509.NameAttribute(NameOID.LOCALITY_NAME, "City"),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, "C2Server"),
+        x509.NameAttribute(NameOID.COMMON_NAME, "localhost"),
+    ])
+
+    # Build certificate
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = x509.CertificateBuilder().subject_name(
+        subject
+    ).issuer_name(
+        issuer
+    ).public_key(
+        private_key.public_key()
+    ).serial_number(
+        x509.random_serial_number()
+    ).not_valid_before(
+        now
+    ).not_valid_after(
+        now + datetime.timedelta(days=VALID_DAYS)
+    ).add_extension(
+        x509.SubjectAlternativeName([
+            x509.DNSName("localhost"),
+            x509.IPAddress(IPv4Address("127.0.0.1")),
+        ]),
+        critical=False,
+    ).sign(private_key, hashes.SHA256())
+
+    # Write private key (PKCS#8 - one format for both EC and RSA keys)
+    Path(key_file).write_bytes(private_key.private_bytes(
         encoding=serialization.Encoding.PEM,
-        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        format=serialization.PrivateFormat.PKCS8,
         encryption_algorithm=serialization.NoEncryption()
     ))
 
-# Write certificate
-with open("certs/server.crt", "wb") as f:
-    f.write(cert.public_bytes(serialization.Encoding.PEM))
-
-print("    [+] Certificate: certs/server.crt")
-print("    [+] Private key: certs/server.key")
-print("    [+] Valid for: 365 days")
-print()
-
-print("=" * 60)
-print("  Setup Complete!")
-print("=" * 60)
-print()
-print("✅ Certificates generated successfully!")
-print()
-print("Next steps:")
-print("  1. Start the server: python c2_server.py")
-print("  2. Start the client: python c2_client.py")
-print("  3. Follow the on-screen instructions!")
-print()
-print("Security features:")
-print("  [+] TLS/SSL encryption (automatic)")
-print("  [+] Per-client token authentication")
-print("  [+] Approval workflow for new clients")
-print("  [+] Token revocation and renewal")
-print()
+    # Write certificate
+    Path(cert_file).write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+
+
+def main():
+    """Regenerate the certificates (manual run)"""
+    print("=" * 60)
+    print("  C2 Security Setup")
+    print("=" * 60)
+    print()
+    print("NOTE: This runs automatically when you start the server!")
+    print("You only need to run this manually to regenerate certificates.")
+    print()
+
+    print("[*] Generating TLS/SSL certificates...")
+    try:
+        generate_certificates()
+    except ImportError:
+        print("[!] Error: cryptography package not found")
+        print("[!] Install with: pip install cryptography")
+        sys.exit(1)
+
+    print(f"    [+] Certificate: {CERT_FILE}")
+    print(f"    [+] Private key: {KEY_FILE}")
+    print(f"    [+] Valid for: {VALID_DAYS} days")
+    print()
+
+    print("=" * 60)
+    print("  Setup Complete!")
+    print("=" * 60)
+    print()
+    print("✅ Certificates generated successfully!")
+    print()
+    print("Next steps:")
+    print("  1. Start the server: python c2_server.py")
+    print("  2. Start the client: python c2_client.py")
+    print("  3. Follow the on-screen instructions!")
+    print()
+    print("Security features:")
+    print("  [+] TLS/SSL encryption (automatic)")
+    print("  [+] Per-client token authentication")
+    print("  [+] Approval workflow for new clients")
+    print("  [+] Token revocation and renewal")
+    print()
+
+
+if __name__ == '__main__':
+    main()
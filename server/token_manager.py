@@ -3,24 +3,142 @@ Token Manager Module
 Handles per-client token storage, validation, and approval workflow
 """
 
+import hashlib
+import queue
 import sqlite3
 import secrets
 import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from common.auth import generate_token
+from common.config import DB_BUSY_TIMEOUT_MS, VALIDATE_CACHE_TTL
 
 # Database file location
 DB_FILE = Path(__file__).parent / 'tokens.db'
 db_lock = threading.Lock()
 
+# Connections are opened once and reused instead of per call: a single writer
+# (only used with db_lock held) and a pool of read-only connections.
+# The database runs in WAL mode, so readers never wait for db_lock or the writer.
+_write_conn = None
+_read_pool = queue.SimpleQueue()
+
+# UPDATE ... RETURNING (SQLite 3.35+) reads and writes a row in one statement
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Statements prepared once per connection and reused from its statement cache
+# (the cache is keyed on the exact SQL text, so every caller shares these strings).
+# Rows stay plain tuples: sqlite3.Row wraps the same tuple in another object and
+# looks names up per access - measurably slower for the token lookup.
+SQL_STATEMENT_CACHE = 256
+SQL_SELECT_TOKEN = 'SELECT token, status FROM tokens WHERE hostname = ?'
+SQL_APPROVE_TOKEN = ("UPDATE tokens SET status = 'approved', approved_at = CURRENT_TIMESTAMP "
+                     "WHERE hostname = ?")
+SQL_APPROVE_RETURNING = ("UPDATE tokens SET status = 'approved', approved_at = CURRENT_TIMESTAMP "
+                         "WHERE hostname = ? AND status <> 'approved' RETURNING token")
+SQL_INSERT_APPROVED = ("INSERT INTO tokens (hostname, token, status, approved_at) "
+                       "VALUES (?, ?, 'approved', CURRENT_TIMESTAMP)")
+SQL_SELECT_PENDING = ("SELECT id, hostname, ip_address, requested_at FROM tokens "
+                      "WHERE status = 'pending' ORDER BY requested_at ASC")
+SQL_SELECT_PENDING_HOSTNAME = "SELECT hostname FROM tokens WHERE id = ? AND status = 'pending'"
+SQL_SELECT_ALL = ("SELECT hostname, status, ip_address, requested_at, approved_at, revoked_at "
+                  "FROM tokens ORDER BY requested_at DESC")
+
+# Bumped on every change to the tokens table so readers can cache query results
+_generation = 0
+
+# Approved tokens seen by validate_client_token: hostname -> (BLAKE2b of token, expires_at).
+# Only the hash is kept so the raw tokens don't linger in memory.
+_validate_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _bump_generation(hostname):
+    """Record a committed change to hostname's token (call with db_lock held, after commit)"""
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        _validate_cache.pop(hostname, None)
+
+
+def _token_hash(token):
+    """
+    Hash a token for the validation cache
+    Returns: bytes - BLAKE2b digest
+    """
+    return hashlib.blake2b(token.encode()).digest()
+
+
+def _cache_token(hostname, token, generation):
+    """Remember hostname's approved token, unless the table changed since generation was read"""
+    with _cache_lock:
+        if _generation == generation:
+            _validate_cache[hostname] = (_token_hash(token), time.monotonic() + VALIDATE_CACHE_TTL)
+
+
+def get_generation():
+    """
+    Get the current change counter of the tokens table
+    Returns: int - differs from an earlier value if tokens changed since
+    """
+    return _generation
+
+
+def _open_connection(read_only=False):
+    """
+    Open a database connection that can be shared between threads
+
+    Args:
+        read_only: Open in read-only mode (for the reader pool)
+
+    Returns:
+        sqlite3.Connection
+    """
+    if read_only:
+        conn = sqlite3.connect(Path(DB_FILE).resolve().as_uri() + '?mode=ro', uri=True,
+                               check_same_thread=False, cached_statements=SQL_STATEMENT_CACHE)
+    else:
+        conn = sqlite3.connect(DB_FILE, check_same_thread=False,
+                               cached_statements=SQL_STATEMENT_CACHE)
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA cache_size = -8000')  # 8MB page cache per connection
+    if not read_only:
+        # Under WAL this only risks the last commits on power loss, never corruption
+        conn.execute('PRAGMA synchronous = NORMAL')
+    return conn
+
+
+def _writer():
+    """
+    Get the shared write connection, opening it on first use (call with db_lock held)
+    Returns: sqlite3.Connection
+    """
+    global _write_conn
+    if _write_conn is None:
+        _write_conn = _open_connection()
+    return _write_conn
+
+
+@contextmanager
+def _read_conn():
+    """Borrow a read-only connection from the pool (opened on demand) and return it after"""
+    try:
+        conn = _read_pool.get_nowait()
+    except queue.Empty:
+        conn = _open_connection(read_only=True)
+    try:
+        yield conn
+    finally:
+        _read_pool.put(conn)
+
 
 def init_database():
     """Initialize the token database with schema"""
-    with db_lock:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-
-        cursor.execute('''
+    with db_lock, _writer() as conn:
+        # Persistent on the database file: lets reads run alongside a write
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('''
             CREATE TABLE IF NOT EXISTS tokens (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 hostname TEXT UNIQUE NOT NULL,
@@ -34,11 +152,15 @@ def init_database():
             )
         ''')
 
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_status ON tokens(status)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_hostname ON tokens(hostname)')
-
-        conn.commit()
-        conn.close()
+        # Pending listing reads only this index: filtered by status, already in
+        # requested_at order, every selected column stored in it (id is the rowid).
+        # It also serves plain status lookups, so the old status-only index goes.
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_pending_cover
+            ON tokens(status, requested_at, hostname, ip_address)
+        ''')
+        conn.execute('DROP INDEX IF EXISTS idx_status')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_hostname ON tokens(hostname)')
 
 
 def request_token(hostname, ip_address):
@@ -46,17 +168,12 @@ def request_token(hostname, ip_address):
     Handle a token request from a client
     Returns: (success: bool, token: str, status: str)
     """
-    with db_lock:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-
+    with db_lock, _writer() as conn:
         # Check if hostname already exists
-        cursor.execute('SELECT token, status FROM tokens WHERE hostname = ?', (hostname,))
-        existing = cursor.fetchone()
+        existing = conn.execute(SQL_SELECT_TOKEN, (hostname,)).fetchone()
 
         if existing:
             token, status = existing
-            conn.close()
 
             # If already approved, return the existing token
             if status == 'approved':
@@ -67,29 +184,27 @@ def request_token(hostname, ip_address):
             # If revoked or denied, update to pending with new token
             else:
                 new_token = generate_token()
-                cursor = sqlite3.connect(DB_FILE).cursor()
-                cursor.execute('''
+                conn.execute('''
                     UPDATE tokens
                     SET token = ?, status = 'pending', ip_address = ?,
                         requested_at = CURRENT_TIMESTAMP, approved_at = NULL, revoked_at = NULL
                     WHERE hostname = ?
                 ''', (new_token, ip_address, hostname))
-                cursor.connection.commit()
-                cursor.connection.close()
+                conn.commit()
+                _bump_generation(hostname)
                 return (True, new_token, 'pending')
 
         # New hostname - create pending token
         token = generate_token()
         try:
-            cursor.execute('''
+            conn.execute('''
                 INSERT INTO tokens (hostname, token, status, ip_address)
                 VALUES (?, ?, 'pending', ?)
             ''', (hostname, token, ip_address))
             conn.commit()
-            conn.close()
+            _bump_generation(hostname)
             return (True, token, 'pending')
         except sqlite3.IntegrityError:
-            conn.close()
             return (False, None, 'error')
 
 
@@ -98,24 +213,27 @@ def validate_client_token(hostname, provided_token):
     Validate a client's token
     Returns: True if token is valid and approved, False otherwise
     """
-    with db_lock:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT token, status FROM tokens WHERE hostname = ?
-        ''', (hostname,))
+    cached = _validate_cache.get(hostname)
+    if cached and time.monotonic() < cached[1]:
+        return secrets.compare_digest(cached[0], _token_hash(provided_token))
 
-        result = cursor.fetchone()
-        conn.close()
+    generation = _generation
+    with _read_conn() as conn:
+        result = conn.execute(SQL_SELECT_TOKEN, (hostname,)).fetchone()
 
         if not result:
             return False
 
         stored_token, status = result
+        if status != 'approved':
+            return False
+        _cache_token(hostname, stored_token, generation)
 
-        # Token must match and status must be approved
-        return secrets.compare_digest(stored_token, provided_token) and status == 'approved'
+    # Token must match - length isn't secret (fixed by generate_token), only the bytes are
+    stored, provided = stored_token.encode(), provided_token.encode()
+    if len(stored) != len(provided):
+        return False
+    return secrets.compare_digest(stored, provided)
 
 
 def approve_token(hostname):
@@ -123,31 +241,30 @@ def approve_token(hostname):
     Approve a pending token request
     Returns: (success: bool, token: str or None)
     """
-    with db_lock:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT token, status FROM tokens WHERE hostname = ?', (hostname,))
-        result = cursor.fetchone()
-
-        if not result:
-            conn.close()
-            return (False, None)
-
-        token, status = result
+    with db_lock, _writer() as conn:
+        if _HAS_RETURNING:
+            # Common case (pending/revoked -> approved) in one statement;
+            # no row back means unknown or already approved
+            rows = conn.execute(SQL_APPROVE_RETURNING, (hostname,)).fetchall()
+            if not rows:
+                result = conn.execute(SQL_SELECT_TOKEN, (hostname,)).fetchone()
+                return (True, result[0]) if result else (False, None)
+            token = rows[0][0]
+        else:
+            result = conn.execute(SQL_SELECT_TOKEN, (hostname,)).fetchone()
+
+            if not result:
+                return (False, None)
+
+            token, status = result
 
-        if status == 'approved':
-            conn.close()
-            return (True, token)  # Already approved
-
-        cursor.execute('''
-            UPDATE tokens
-            SET status = 'approved', approved_at = CURRENT_TIMESTAMP
-            WHERE hostname = ?
-        ''', (hostname,))
+            if status == 'approved':
+                return (True, token)  # Already approved
 
+            conn.execute(SQL_APPROVE_TOKEN, (hostname,))
         conn.commit()
-        conn.close()
+        _bump_generation(hostname)
+        _cache_token(hostname, token, _generation)
         return (True, token)
 
 
@@ -156,19 +273,15 @@ def deny_token(hostname):
     Deny a pending token request
     Returns: success: bool
     """
-    with db_lock:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-
-        cursor.execute('''
+    with db_lock, _writer() as conn:
+        rows_affected = conn.execute('''
             UPDATE tokens
             SET status = 'denied'
             WHERE hostname = ?
-        ''', (hostname,))
-
-        rows_affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+        ''', (hostname,)).rowcount
+        if rows_affected:
+            conn.commit()
+            _bump_generation(hostname)
         return rows_affected > 0
 
 
@@ -177,19 +290,15 @@ def revoke_token(hostname):
     Revoke an approved token
     Returns: success: bool
     """
-    with db_lock:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-
-        cursor.execute('''
+    with db_lock, _writer() as conn:
+        rows_affected = conn.execute('''
             UPDATE tokens
             SET status = 'revoked', revoked_at = CURRENT_TIMESTAMP
             WHERE hostname = ?
-        ''', (hostname,))
-
-        rows_affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+        ''', (hostname,)).rowcount
+        if rows_affected:
+            conn.commit()
+            _bump_generation(hostname)
         return rows_affected > 0
 
 
@@ -198,81 +307,142 @@ def add_token_manual(hostname):
     Manually add and approve a token for a hostname
     Returns: (success: bool, token: str or None)
     """
-    with db_lock:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-
+    with db_lock, _writer() as conn:
         # Check if already exists
-        cursor.execute('SELECT token, status FROM tokens WHERE hostname = ?', (hostname,))
-        existing = cursor.fetchone()
+        existing = conn.execute(SQL_SELECT_TOKEN, (hostname,)).fetchone()
 
         if existing:
             token, status = existing
             if status != 'approved':
                 # Update to approved
-                cursor.execute('''
-                    UPDATE tokens
-                    SET status = 'approved', approved_at = CURRENT_TIMESTAMP
-                    WHERE hostname = ?
-                ''', (hostname,))
+                conn.execute(SQL_APPROVE_TOKEN, (hostname,))
                 conn.commit()
-            conn.close()
+                _bump_generation(hostname)
             return (True, token)
 
         # Create new approved token
         token = generate_token()
         try:
-            cursor.execute('''
-                INSERT INTO tokens (hostname, token, status, approved_at)
-                VALUES (?, ?, 'approved', CURRENT_TIMESTAMP)
-            ''', (hostname, token))
+            conn.execute(SQL_INSERT_APPROVED, (hostname, token))
             conn.commit()
-            conn.close()
+            _bump_generation(hostname)
             return (True, token)
         except sqlite3.IntegrityError:
-            conn.close()
             return (False, None)
 
 
+def bulk_approve(hostnames):
+    """
+    Approve several tokens in one transaction (one commit instead of one per hostname)
+
+    Args:
+        hostnames: Iterable of hostnames to approve
+
+    Returns:
+        list: (hostname, token) for every hostname that exists - unknown ones are skipped
+    """
+    with db_lock, _writer() as conn:
+        found = []
+        for hostname in dict.fromkeys(hostnames):
+            result = conn.execute(SQL_SELECT_TOKEN, (hostname,)).fetchone()
+            if result:
+                found.append((hostname, result[0], result[1]))
+
+        to_approve = [(hostname,) for hostname, _, status in found if status != 'approved']
+        if to_approve:
+            conn.executemany(SQL_APPROVE_TOKEN, to_approve)
+            conn.commit()
+
+        for hostname, token, status in found:
+            if status != 'approved':
+                _bump_generation(hostname)
+                _cache_token(hostname, token, _generation)
+        return [(hostname, token) for hostname, token, _ in found]
+
+
+def bulk_add_tokens(hostnames):
+    """
+    Manually add and approve tokens for several hostnames in one transaction
+
+    Behaves like add_token_manual for each hostname: existing tokens are kept
+    (and approved if needed), new hostnames get a fresh approved token.
+
+    Args:
+        hostnames: Iterable of hostnames
+
+    Returns:
+        list: (hostname, token) for every hostname, in the order given
+    """
+    with db_lock, _writer() as conn:
+        tokens = {}
+        to_insert = []
+        to_approve = []
+        for hostname in dict.fromkeys(hostnames):
+            existing = conn.execute(SQL_SELECT_TOKEN, (hostname,)).fetchone()
+            if existing:
+                tokens[hostname] = existing[0]
+                if existing[1] != 'approved':
+                    to_approve.append((hostname,))
+            else:
+                tokens[hostname] = generate_token()
+                to_insert.append((hostname, tokens[hostname]))
+
+        if to_insert or to_approve:
+            conn.executemany(SQL_INSERT_APPROVED, to_insert)
+            conn.executemany(SQL_APPROVE_TOKEN, to_approve)
+            conn.commit()
+            for hostname, *_ in to_insert + to_approve:
+                _bump_generation(hostname)
+        return list(tokens.items())
+
+
 def get_pending_requests():
     """
     Get all pending token requests
-    Returns: List of (hostname, ip_address, requested_at)
+    Returns: List of (id, hostname, ip_address, requested_at) - id is stable, use it to refer to a request
     """
-    with db_lock:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+    with _read_conn() as conn:
+        return conn.execute(SQL_SELECT_PENDING).fetchall()
 
-        cursor.execute('''
-            SELECT hostname, ip_address, requested_at
-            FROM tokens
-            WHERE status = 'pending'
-            ORDER BY requested_at ASC
-        ''')
 
-        results = cursor.fetchall()
-        conn.close()
-        return results
+def get_pending_hostname_by_id(token_id):
+    """
+    Get the hostname of a pending token request by its id
+    Returns: hostname or None
+    """
+    with _read_conn() as conn:
+        result = conn.execute(SQL_SELECT_PENDING_HOSTNAME, (token_id,)).fetchone()
 
+        return result[0] if result else None
 
-def get_all_tokens():
+
+def iter_all_tokens(batch=500):
     """
-    Get all tokens with their status
-    Returns: List of (hostname, status, ip_address, requested_at, approved_at)
+    Stream all tokens with their status, fetching batch rows at a time
+
+    The pooled connection is held until the iterator is exhausted or closed.
+
+    Args:
+        batch: Rows fetched from SQLite per round trip
+
+    Yields:
+        (hostname, status, ip_address, requested_at, approved_at, revoked_at)
     """
-    with db_lock:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+    with _read_conn() as conn:
+        cursor = conn.execute(SQL_SELECT_ALL)
+        cursor.arraysize = batch
+        rows = cursor.fetchmany()
+        while rows:
+            yield from rows
+            rows = cursor.fetchmany()
 
-        cursor.execute('''
-            SELECT hostname, status, ip_address, requested_at, approved_at, revoked_at
-            FROM tokens
-            ORDER BY requested_at DESC
-        ''')
 
-        results = cursor.fetchall()
-        conn.close()
-        return results
+def get_all_tokens():
+    """
+    Get all tokens with their status
+    Returns: List of (hostname, status, ip_address, requested_at, approved_at, revoked_at)
+    """
+    return list(iter_all_tokens())
 
 
 def get_token_by_hostname(hostname):
@@ -280,13 +450,8 @@ def get_token_by_hostname(hostname):
     Get token info for a specific hostname
     Returns: (token, status) or (None, None)
     """
-    with db_lock:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT token, status FROM tokens WHERE hostname = ?', (hostname,))
-        result = cursor.fetchone()
-        conn.close()
+    with _read_conn() as conn:
+        result = conn.execute(SQL_SELECT_TOKEN, (hostname,)).fetchone()
 
         if result:
             return result
@@ -298,12 +463,9 @@ def delete_token(hostname):
     Completely delete a token entry
     Returns: success: bool
     """
-    with db_lock:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-
-        cursor.execute('DELETE FROM tokens WHERE hostname = ?', (hostname,))
-        rows_affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+    with db_lock, _writer() as conn:
+        rows_affected = conn.execute('DELETE FROM tokens WHERE hostname = ?', (hostname,)).rowcount
+        if rows_affected:
+            conn.commit()
+            _bump_generation(hostname)
         return rows_affected > 0
@@ -0,0 +1,66 @@
+"""
+Client Handler Tests
+Command result collection against a fake client on a socket pair
+"""
+
+import socket
+import threading
+import unittest
+from unittest import mock
+
+from common.protocol import send_message, recv_message
+from server import client_handler
+
+
+class SendCommandOutputLimitTest(unittest.TestCase):
+    """send_command_to_client must not buffer more than MAX_MESSAGE_SIZE of output"""
+
+    LIMIT = 1000
+
+    def setUp(self):
+        self.server_sock, self.client_sock = socket.socketpair()
+        info = {
+            'session_id': 'test',
+            'socket': self.server_sock,
+            'address': ('127.0.0.1', 0),
+            'lock': threading.Lock(),
+        }
+        patcher = mock.patch.object(client_handler, 'clients', {'host': info})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.server_sock.close)
+        self.addCleanup(self.client_sock.close)
+
+    def _fake_client(self, chunks):
+        """Answer one command with the given (stream, data) chunks, then RESULT"""
+        recv_message(self.client_sock)
+        for stream, data in chunks:
+            send_message(self.client_sock, b'RESULT_CHUNK:' + stream + b':' + data)
+        send_message(self.client_sock, b'RESULT:')
+
+    def _run(self, chunks):
+        client = threading.Thread(target=self._fake_client, args=(chunks,))
+        client.start()
+        with mock.patch.object(client_handler, 'MAX_MESSAGE_SIZE', self.LIMIT):
+            result = client_handler.send_command_to_client('host', 'yes')
+        client.join(5)
+        return result
+
+    def test_output_over_limit_is_truncated(self):
+        # 3x the limit across both streams - reading must continue to the final RESULT
+        chunks = [(b'stdout', b'y' * 300)] * 8 + [(b'stderr', b'e' * 300)] * 2
+        stdout, stderr = self._run(chunks)
+
+        self.assertEqual(len(stdout) + len(stderr.replace('\n[output truncated]', '')), self.LIMIT)
+        self.assertTrue(stderr.endswith('[output truncated]'))
+        self.assertIn('host', client_handler.clients)  # Session kept
+
+    def test_output_under_limit_is_complete(self):
+        stdout, stderr = self._run([(b'stdout', b'a' * 400), (b'stderr', b'b' * 100)])
+
+        self.assertEqual(stdout, 'a' * 400)
+        self.assertEqual(stderr, 'b' * 100)
+
+
+if __name__ == '__main__':
+    unittest.main()